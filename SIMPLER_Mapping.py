@@ -9,23 +9,53 @@ Written by:
 The "RUN TIME parameters" part includes the next parameters:
     ROW_SIZE - a list of row sizes to run the algorithm with.
     JSON_CODE_GEN - to create an execution sequence JSON file, set this flag to TRUE.
+    SEQUENCE_FORMAT - the execution sequence file format: 'JSON' (JSON_<row size>_<benchmark>.json),
+                      'JSONL' (JSON Lines) or 'TEXT' (SEQ_<row size>_<benchmark>.jsonl/.txt). It is streamed into the file.
+                      'BINARY' for the fixed width microcode format (MC_<row size>_<benchmark>.bin, see MicrocodeReader).
+    verify_mapping - the number of random input vectors every mapping is simulated with, against its netlist (0 - no check).
+    emulate_rows - the number of crossbar rows every mapping is run on by the numpy crossbar emulator, which reports
+                   its rows/sec and gate ops/sec (0 - no emulation).
     PRINT_CODE_GEN - to enable information print, set the flag to True. 
     PRINT_WARNING - to enable warnings print, set the flag to True.
     Max_num_gates - the maximum number of gates the tool generates a mapping to 
     SORT_ROOTS - for arbitrary roots order set to 'NO'. For ascending roots order (by CU value) set to 'ASCEND'.
-                 For descending roots order (by CU value) set to 'DESCEND'.
+                 For descending roots order (by CU value) set to 'DESCEND'. 'SEARCH' maps with many roots orders
+                 and keeps the one with the fewest cycles (see Search_Root_Order and ROOT_SEARCH).
+    ROOT_SEARCH - the root order search settings (a RootSearch): time budget (seconds, 0 - none), number of random
+                  orders, random seed, cost ('CYCLES' - total cycles, 'REUSE' - reuse cycles) and number of processes.
+    ALLOCATION_ENGINE - 'STACK' for the non-recursive allocation (AllocateRow), 'RECURSIVE' for the original
+                        recursive one (AllocateRow_Recursive). Both give the same mapping. 'LIST' for the list
+                        scheduling of all the gates at once (AllocateList), in place of the depth-first roots order.
+    num_of_workers - the number of processes SIMPLER_Main maps the row sizes with (1 - sequential).
+    PARTITION - to map a netlist that is too big (Max_num_gates) or does not fit into the row into several rows,
+                set the flag to True (see Map_Partitioned). TRANSFER_COST is the cycles per value moved between rows.
 
 ''' 
 
-#import numpy as np
+try:
+    import numpy as np
+except ImportError: #numpy is only needed by the crossbar emulator
+    np = None
 import simplejson
-from collections import OrderedDict
+from collections import OrderedDict, namedtuple, deque
 import time
 import re
 from collections import OrderedDict
 import itertools
 import math
-import copy
+import random
+from array import array
+import io
+import os
+import sys
+import struct
+import mmap
+import tempfile
+import shutil
+import contextlib
+import multiprocessing
+import heapq
+import synopsys_dc
 
 #================ Globals variables and Classes =================
 
@@ -423,24 +453,160 @@ GATE_NUM_OF_OUTS = {
     # "c_bw16_xnor2" : "c_bw16_xnor2 %s ( .A1(%s), .B1(%s), .A2(%s), .B2(%s), .A3(%s), .B3(%s), .A4(%s), .B4(%s), .A5(%s), .B5(%s), .A6(%s), .B6(%s), .A7(%s), .B7(%s), .A8(%s), .B8(%s), .A9(%s), .B9(%s), .A10(%s), .B10(%s), .A11(%s), .B11(%s), .A12(%s), .B12(%s), .A13(%s), .B13(%s), .A14(%s), .B14(%s), .A15(%s), .B15(%s), .A16(%s), .B16(%s), .Y1(%s), .Y2(%s), .Y3(%s), .Y4(%s), .Y5(%s), .Y6(%s), .Y7(%s), .Y8(%s), .Y9(%s), .Y10(%s), .Y11(%s), .Y12(%s), .Y13(%s), .Y14(%s), .Y15(%s), .Y16(%s) );",   
 # }
 
-class GraphEdge:
-
-    def __init__(self,Source,Dest,Val):
-        self.s = Source
-        self.d = Dest
-        self.v = Val
-
-    def GetDest(self):
-        return self.d
-
-    def GetSource(self):
-        return self.s
-
-    def GetVal(self):
-        return self.v
+#================ Netlist reader =================
+
+# A gate declaration of the synthesized netlist: cell type (a GATE_TIME key), instance name, and pin -> net bindings (in pins order)
+NetlistGate = namedtuple('NetlistGate', ['cell', 'name', 'pins', 'text'])
+
+DECLARATION_RE = re.compile(r"\s*(input|output|wire)\s+(.*)", re.DOTALL)
+PIN_RE = re.compile(r"\.\s*(\w+)\s*\(\s*(.*?)\s*\)", re.DOTALL)
+
+class NetlistReader:
+    #Streams a gate level Verilog netlist statement by statement and yields a NetlistGate per gate declaration.
+    #The input/output/wire declarations are collected on the way (one names list per declaration), and every other
+    #statement (module header, endmodule, ...) is kept as raw text so the netlist can be written back.
+
+    def __init__(self, bmfId, gate_names=None):
+        self.bmfId = bmfId
+        if gate_names is None:
+            gate_names = GATE_TIME.keys()
+        # Single alternation over the cell types, longest first so that no cell name shadows a longer one
+        alternation = "|".join(re.escape(name) for name in sorted(gate_names, key=len, reverse=True))
+        self.gate_re = re.compile(r"\s*(%s)\s+(\S+)\s*\(" % alternation)
+        self.declarations = {'input': [], 'output': [], 'wire': []}
+        self.other_statements = []
+
+    def statements(self):
+        #Yields the raw text of the netlist statements (without the terminating ';'), reading one line at a time
+        buf = []
+        for line in self.bmfId:
+            comment_idx = line.find('//')
+            if comment_idx != -1: #Ignore comments
+                line = line[:comment_idx] + '\n'
+            while ';' in line:
+                head, _, line = line.partition(';')
+                buf.append(head)
+                yield ''.join(buf), True
+                buf = []
+            buf.append(line)
+        tail = ''.join(buf)
+        if tail.strip():
+            yield tail, False
+
+    def __iter__(self):
+        for statement, terminated in self.statements():
+            gate_match = self.gate_re.match(statement)
+            if gate_match:
+                pins = OrderedDict(PIN_RE.findall(statement, gate_match.end()))
+                yield NetlistGate(gate_match.group(1), gate_match.group(2), pins, statement.strip() + ';')
+                continue
+            decl_match = DECLARATION_RE.match(statement)
+            if decl_match:
+                self.declarations[decl_match.group(1)].append([name.strip() for name in decl_match.group(2).split(",")])
+            self.other_statements.append(statement + ';' if terminated else statement)
+
+class NetlistModule:
+    #A netlist held in memory between the flow stages: it is parsed once, transformed in place by the fusion
+    #passes (tieConstants, fuseGates) and mapped directly (SIMPLER_Netlist). Writing it is only needed for debug.
+
+    def __init__(self, bmfId, name):
+        self.name = name
+        reader = NetlistReader(bmfId)
+        self.gates = list(reader)
+        self.declarations = reader.declarations
+        self.other_statements = reader.other_statements
+        self.added_statements = [] # Statements the passes add in front of the gates (e.g. wire declarations)
 
-    def Print(self):
-        print('(' + str(self.s) + ',' + str(self.d) + '), edge val is:' + str(self.v))
+    @classmethod
+    def FromGates(cls, name, inputs, outputs, wires, gates):
+        #A module made of the given gates (NetlistGate) and declarations, e.g. a partition of a bigger netlist
+        module = cls.__new__(cls)
+        module.name = name
+        module.gates = list(gates)
+        module.declarations = {'input': [list(inputs)], 'output': [list(outputs)], 'wire': [list(wires)]}
+        module.other_statements = ["module %s ( %s );" % (name, ", ".join(list(inputs) + list(outputs)))]
+        for kind in ('input', 'output', 'wire'):
+            if module.declarations[kind][0]:
+                module.other_statements.append("\n  %s %s;" % (kind, ", ".join(module.declarations[kind][0])))
+        module.other_statements.append("\nendmodule\n")
+        module.added_statements = []
+        return module
+
+    def Write(self, path):
+        data = "".join(self.other_statements)
+        ind = data.find("endmodule")
+        open(path, "w").write(data[:ind] + "\n".join(self.added_statements + [gate.text for gate in self.gates]) + "\n" + data[ind:])
+
+#============== End of Netlist reader ============
+
+class GraphAdjacency:
+    #Frozen compressed sparse row (CSR) representation of the netlist graph, built once after parsing.
+    #For node V_i, the fanout (parents) is fanout_idx[fanout_ptr[V_i]:fanout_ptr[V_i+1]] and the fanin is
+    #fanin_idx[fanin_ptr[V_i]:fanin_ptr[V_i+1]], both in edge insertion order. The children of V_i without the
+    #netlist inputs (fanin reversed, inputs filtered) are precomputed the same way for the allocation hot loop.
+
+    def __init__(self,NumOfNodes,Sources,Dests,NumOfInputs):
+        self.num_of_nodes = NumOfNodes
+        self.num_of_edges = len(Sources)
+        self.fanout_ptr, self.fanout_idx = self.BuildRows(NumOfNodes,Sources,Dests)
+        self.fanin_ptr, self.fanin_idx = self.BuildRows(NumOfNodes,Dests,Sources)
+        self.children_ptr = array('i',[0])
+        self.children_idx = array('i')
+        for V_i in range(NumOfNodes):
+            fanin = self.fanin_idx[self.fanin_ptr[V_i]:self.fanin_ptr[V_i+1]]
+            self.children_idx.extend(child for child in reversed(fanin) if child >= NumOfInputs)
+            self.children_ptr.append(len(self.children_idx))
+        self.Levelize(NumOfInputs)
+
+    @staticmethod
+    def BuildRows(NumOfNodes,Rows,Cols):
+        #Counting sort of the (row,col) pairs by row. Stable, so each row keeps the insertion order of its cols
+        ptr = array('i',[0]) * (NumOfNodes + 1)
+        for row in Rows:
+            ptr[row + 1] += 1
+        for V_i in range(NumOfNodes):
+            ptr[V_i + 1] += ptr[V_i]
+        idx = array('i',[0]) * len(Rows)
+        fill = array('i',ptr)
+        for row,col in zip(Rows,Cols):
+            idx[fill[row]] = col
+            fill[row] += 1
+        return ptr, idx
+
+    def Levelize(self,NumOfInputs):
+        #Kahn's algorithm over the gate to gate edges. level[V_i] is 0 for a gate without gate children and
+        #1 + the max level of its children otherwise. level_idx lists the gates level by level (children before
+        #parents), level_ptr holds the start of every level. Netlist inputs are not levelized.
+        remaining = array('i',(self.children_ptr[V_i+1] - self.children_ptr[V_i] for V_i in range(self.num_of_nodes)))
+        self.level = array('i',[0]) * self.num_of_nodes
+        order = [V_i for V_i in range(NumOfInputs,self.num_of_nodes) if remaining[V_i] == 0]
+        for V_i in order: # order grows while iterating
+            for parent in self.GetFanout(V_i):
+                if self.level[parent] <= self.level[V_i]:
+                    self.level[parent] = self.level[V_i] + 1
+                remaining[parent] -= 1
+                if remaining[parent] == 0:
+                    order.append(parent)
+        num_of_levels = max((self.level[V_i] for V_i in order), default=-1) + 1
+        self.level_ptr, self.level_idx = self.BuildRows(num_of_levels,[self.level[V_i] for V_i in order],order)
+
+    def GetLevelizedNodes(self):
+        return self.level_idx
+
+    def GetFanout(self,V_i):
+        return self.fanout_idx[self.fanout_ptr[V_i]:self.fanout_ptr[V_i+1]]
+
+    def GetFanin(self,V_i):
+        return self.fanin_idx[self.fanin_ptr[V_i]:self.fanin_ptr[V_i+1]]
+
+    def GetChildrenWithoutInputs(self,V_i):
+        return self.children_idx[self.children_ptr[V_i]:self.children_ptr[V_i+1]]
+
+    def GetNumOfFanout(self,V_i):
+        return self.fanout_ptr[V_i+1] - self.fanout_ptr[V_i]
+
+    def GetNumOfFanin(self,V_i):
+        return self.fanin_ptr[V_i+1] - self.fanin_ptr[V_i]
 
 class NodeData:
     
@@ -473,10 +639,6 @@ class NodeData:
         self.time = Time
         self.SIMPLER_lists_node = None
 
-        self.out_edges = []
-        self.in_edges = []
-        self.num_of_out_edges = 0
-        self.num_of_in_edges = 0
         self.intermediateCells = []
         self.output_list = []
         self.input_list = []
@@ -554,48 +716,6 @@ class NodeData:
     def PrintNodeData(self):
         print('node_num =',self.node_num,'inputs_list =',self.inputs_list,'op =',self.op,'cell =',self.map,'time =',self.time,'CU =',self.CU,'FO =',self.FO)
 
-    def AddOutEdge(self,Dest,Val):
-        self.out_edges.append(GraphEdge(self.node_num,Dest,Val))
-        self.num_of_out_edges += 1
-
-    def AddInEdge(self,Source,Val):
-        self.in_edges.append(GraphEdge(Source,self.node_num,Val))
-        self.num_of_in_edges += 1
-        
-    def RemoveOutEdge(self,Dest):
-        for i,e in enumerate(self.out_edges):
-            if e.GetDest() == Dest:
-                del self.out_edges[i]
-                self.num_of_out_edges -= 1
-                break
-
-    def RemoveInEdge(self,Source):
-        for i,e in enumerate(self.in_edges):
-            if e.GetSource() == Source:
-                del self.in_edges[i]
-                self.num_of_in_edges -= 1
-                break
-
-    def GetNumOfOutEdges(self):
-        return self.num_of_out_edges
-
-    def GetNumOfInEdges(self):
-        return self.num_of_in_edges
-
-    def GetOutEdgesList(self,TrueDepFlag):
-        if TrueDepFlag:
-            return [e.GetDest() for e in self.out_edges if e.GetVal()==1]
-        else:
-            return [e.GetDest() for e in self.out_edges]
-
-    def GetInEdgesList(self,TrueDepFlag):
-        if TrueDepFlag:
-            L = [e.GetSource() for e in self.in_edges if e.GetVal()==1]
-            L.reverse()
-            return L
-        else:
-            return [e.GetSource() for e in self.in_edges]
-
 class CellInfo:
     
     #States declarations 
@@ -621,222 +741,425 @@ class CellInfo:
         cls.cur_num_of_used_cells = 0   
 
     #End of class methods
-    
-    def __init__(self,Idx):
-        self.state = CellInfo.Available
-        #self.current_gate = -1
-        self.next = None
-        self.prev = None
-        self.cell_idx = Idx
-        self.current_gate_num = None
-
-    def GetCellIdx(self):
-        return self.cell_idx
-
-    def SetNext(self,idx):
-        self.next = idx
-        
-    def SetPrev(self,idx):
-        self.prev = idx
-
-    def GetNext(self):
-        return self.next
-        
-    def GetPrev(self):
-        return self.prev
-
-    def SetCurGateNum(self,gate_num):
-        self.current_gate_num = gate_num
-
-    def GetCurGateNum(self):
-        return self.current_gate_num
-
 
 
 class CellsInfo:
+    #Manages the row cells. The available/init/used lists are doubly linked lists threaded through flat integer
+    #arrays (next/prev/list tag/current gate per cell, -1 stands for None), so insert, remove and splice are O(1).
+    #The state of a cell is the state of the list tag it carries. Splicing the init list into the available list
+    #re-labels the init tag as available instead of touching every moved cell.
+
+    NONE = -1
 
     def __init__(self,N):
-        self.used_head = None
-        self.used_tail = None
-        self.init_head = None
-        self.init_tail = None
-        self.available_head = None
-        self.available_tail = None
-        self.cells = [CellInfo(idx) for idx in range(0,N)]
+        self.next = array('i',[CellsInfo.NONE]) * N
+        self.prev = array('i',[CellsInfo.NONE]) * N
+        self.current_gate = array('i',[CellsInfo.NONE]) * N
+        self.list_tag = array('i',[0]) * N # 0 - the cell is not in any list
+        self.tag_state = [None, CellInfo.Available, CellInfo.Used, CellInfo.Init]
+        self.init_tag = CellInfo.Init
+        self.head = array('i',[CellsInfo.NONE]) * 4 # indexed by state
+        self.tail = array('i',[CellsInfo.NONE]) * 4
         self.init_list_for_json = []
+        self.num_of_used = 0 # cells in the used list (live values), and its peak
+        self.max_num_of_used = 0
+
+    #Generic list methods
+    def GetState(self,cell_idx):
+        return self.tag_state[self.list_tag[cell_idx]]
+
+    def GetCurGateNum(self,cell_idx):
+        gate_num = self.current_gate[cell_idx]
+        return None if gate_num == CellsInfo.NONE else gate_num
+
+    def Push_Front(self,state,tag,cell_idx):
+        head = self.head[state]
+        self.next[cell_idx] = head
+        self.prev[cell_idx] = CellsInfo.NONE
+        if head == CellsInfo.NONE:
+            self.tail[state] = cell_idx
+        else:
+            self.prev[head] = cell_idx
+        self.head[state] = cell_idx
+        self.list_tag[cell_idx] = tag
+
+    def Remove(self,cell_idx):
+        state = self.GetState(cell_idx)
+        next_cell = self.next[cell_idx]
+        prev_cell = self.prev[cell_idx]
+        if prev_cell == CellsInfo.NONE:
+            self.head[state] = next_cell
+        else:
+            self.next[prev_cell] = next_cell
+        if next_cell == CellsInfo.NONE:
+            self.tail[state] = prev_cell
+        else:
+            self.prev[next_cell] = prev_cell
+        self.next[cell_idx] = self.prev[cell_idx] = CellsInfo.NONE
+        self.list_tag[cell_idx] = 0
+
+    def First(self,state):
+        head = self.head[state]
+        return None if head == CellsInfo.NONE else head
 
     #Available list methods
     def GetFirst_Available(self):
-        if self.available_head == None:
-            return None
-        else:
-            return self.cells[self.available_head].GetCellIdx()
+        return self.First(CellInfo.Available)
 
     def Concatenate_init_to_available_list(self):
-        self.available_head = self.init_head
-        self.available_tail = self.init_tail
-        self.cells[self.available_tail].SetNext(None)
-        self.cells[self.available_head].SetPrev(None)
-        self.init_head = None
-        self.init_tail = None
+        #Splices the init list after the available list tail
+        init_head = self.head[CellInfo.Init]
+        if init_head == CellsInfo.NONE:
+            return
+        available_tail = self.tail[CellInfo.Available]
+        if available_tail == CellsInfo.NONE:
+            self.head[CellInfo.Available] = init_head
+        else:
+            self.next[available_tail] = init_head
+            self.prev[init_head] = available_tail
+        self.tail[CellInfo.Available] = self.tail[CellInfo.Init]
+        self.head[CellInfo.Init] = self.tail[CellInfo.Init] = CellsInfo.NONE
+        self.tag_state[self.init_tag] = CellInfo.Available
+        self.init_tag = len(self.tag_state)
+        self.tag_state.append(CellInfo.Init)
 
     def DeleteFirst_Available(self):
-        if self.available_head == self.available_tail:
-            self.cells[self.available_head].SetNext(None)
-            self.cells[self.available_head].SetPrev(None)
-            self.available_head = self.available_tail = None
-        else:
-            next_available_cell = self.cells[self.available_head].GetNext()
-            self.cells[self.available_head].SetNext(None)
-            self.available_head = next_available_cell
-            self.cells[next_available_cell].SetPrev(None)
+        self.Remove(self.head[CellInfo.Available])
 
     def Insert_Available(self,cell_idx):
-        if self.available_head == None:
-            self.available_head = cell_idx
-            self.available_tail = cell_idx
-        else:
-            self.cells[self.available_head].SetPrev(cell_idx)
-            self.cells[cell_idx].SetNext(self.available_head)
-            self.available_head = cell_idx
+        self.Push_Front(CellInfo.Available,CellInfo.Available,cell_idx)
+
     #Init list methods
     def IsNotEmpty_Init(self):
-        if self.init_head == None:
-            return False
-        else:
-            return True
+        return self.head[CellInfo.Init] != CellsInfo.NONE
 
     def Empty_Init(self):
-        self.init_tail = None
-        self.init_head = None
+        cell_idx = self.head[CellInfo.Init]
+        while cell_idx != CellsInfo.NONE: # Only when the init list was not concatenated to the available list
+            next_cell = self.next[cell_idx]
+            self.Remove(cell_idx)
+            cell_idx = next_cell
         self.init_list_for_json = []
 
     def Insert_Init(self,cell_idx, add_gate=False):
-        if self.init_head == None:
-            self.init_head = cell_idx
-            self.init_tail = cell_idx
-        else:
-            self.cells[self.init_head].SetPrev(cell_idx)
-            self.cells[cell_idx].SetNext(self.init_head)
-            self.init_head = cell_idx
+        self.Push_Front(CellInfo.Init,self.init_tag,cell_idx)
         if add_gate:
-            self.init_list_for_json.append([self.cells[cell_idx].GetCurGateNum(),cell_idx])
+            self.init_list_for_json.append([self.GetCurGateNum(cell_idx),cell_idx])
         #else:
         #    self.init_list_for_json.append([None,cell_idx])
 
     #Used list methods
     def Insert_Used(self,cell_idx,gate_num):
-        if self.used_head == None:
-            self.used_head = cell_idx
-            self.used_tail = cell_idx
-        else:
-            self.cells[self.used_head].SetPrev(cell_idx)
-            self.cells[cell_idx].SetNext(self.used_head)
-            self.used_head = cell_idx
-        self.cells[cell_idx].SetCurGateNum(gate_num)
+        self.Push_Front(CellInfo.Used,CellInfo.Used,cell_idx)
+        self.current_gate[cell_idx] = gate_num
+        self.num_of_used += 1
+        if self.num_of_used > self.max_num_of_used:
+            self.max_num_of_used = self.num_of_used
 
     def Delete_Used(self,cell_idx):
-        next_cell =  self.cells[cell_idx].GetNext()
-        prev_cell =  self.cells[cell_idx].GetPrev()
-
-        if self.used_head == self.used_tail and self.used_tail == cell_idx:
-            self.cells[cell_idx].SetNext(None)
-            self.cells[cell_idx].SetPrev(None)
-            self.used_tail = self.used_head = None
-        elif cell_idx == self.used_head:
-            next_head = self.cells[cell_idx].GetNext()
-            self.cells[cell_idx].SetNext(None)
-            self.used_head = next_head
-        elif cell_idx == self.used_tail:
-            next_tail = self.cells[cell_idx].GetPrev()
-            self.cells[cell_idx].SetPrev(None)
-            self.used_tail = None
-        else:
-            next_cell = self.cells[cell_idx].GetNext()
-            prev_cell = self.cells[cell_idx].GetPrev()
-            self.cells[cell_idx].SetNext(None)
-            self.cells[cell_idx].SetPrev(None)
-            self.cells[next_cell].SetPrev(prev_cell)
-            self.cells[prev_cell].SetPrev(next_cell)
+        self.Remove(cell_idx)
+        self.num_of_used -= 1
         
 # End of class CellState 
 
 
 
-class GraphNode:
-
-    def __init__(self,NodeNum):
-        self.node_num = NodeNum
-        self.out_edges = []
-        self.in_edges = []
-        self.num_of_out_edges = 0
-        self.num_of_in_edges = 0
-
-    def AddOutEdge(self,Dest,Val):
-        self.out_edges.append(GraphEdge(self.node_num,Dest,Val))
-        self.num_of_out_edges += 1
-
-    def AddInEdge(self,Source,Val):
-        self.in_edges.append(GraphEdge(Source,self.node_num,Val))
-        self.num_of_in_edges += 1
-        
-    def RemoveOutEdge(self,Dest):
-        for i,e in enumerate(self.out_edges):
-            if e.GetDest() == Dest:
-                del self.out_edges[i]
-                self.num_of_out_edges -= 1
-                break
-
-    def RemoveInEdge(self,Source):
-        for i,e in enumerate(self.in_edges):
-            if e.GetSource() == Source:
-                del self.in_edges[i]
-                self.num_of_in_edges -= 1
-                break
-
-    def GetNumOfOutEdges(self):
-        return self.num_of_out_edges
-
-    def GetNumOfInEdges(self):
-        return self.num_of_in_edges
+class ExecutionSequenceWriter:
+    #Streams the execution sequence of a mapping into a file entry by entry, through a buffered file, so the
+    #sequence is never held in memory. The header (benchmark data) is written first. Formats:
+    #   'JSON'  - the same document simplejson.dump(indent=4) creates, the sequence under 'Execution sequence'.
+    #             Like in a dict, an entry replaces the previous one of the same T<n> key (they are adjacent, by time)
+    #   'JSONL' - JSON Lines: the header object, then a {"T<n>": entry} object per line
+    #   'TEXT'  - "key: value" header lines, then a "T<n>:entry" line per entry
+
+    FILE_PREFIX = {'JSON': 'JSON_', 'JSONL': 'SEQ_', 'TEXT': 'SEQ_'}
+    FILE_EXTENSION = {'JSON': '.json', 'JSONL': '.jsonl', 'TEXT': '.txt'}
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, path, sequence_format, header):
+        if sequence_format not in self.FILE_EXTENSION:
+            raise ValueError("unknown execution sequence format %s" % sequence_format)
+        self.sequence_format = sequence_format
+        self.f = open(path, 'w', buffering=self.BUFFER_SIZE)
+        self.num_of_entries = 0
+        self.pending = None # JSON: the last entry, written once the next key is known
+        if sequence_format == 'JSON':
+            self.f.write('{\n' + ''.join('    %s: %s,\n' % (simplejson.dumps(k), simplejson.dumps(v)) for k, v in header.items()) + '    "Execution sequence": {')
+        elif sequence_format == 'JSONL':
+            self.f.write(simplejson.dumps(header) + '\n')
+        else:
+            self.f.write(''.join('%s: %s\n' % (k, v) for k, v in header.items()))
 
-    def GetOutEdgesList(self,TrueDepFlag):
-        if TrueDepFlag:
-            return [e.GetDest() for e in self.out_edges if e.GetVal()==1]
+    @classmethod
+    def FileName(cls, sequence_format, RowSize, Benchmark):
+        #Next to the benchmark: a Benchmark of dir/name is written to dir/<prefix><RowSize>_name<extension>
+        directory, name = os.path.split(Benchmark)
+        return os.path.join(directory, cls.FILE_PREFIX[sequence_format] + str(RowSize) + '_' + name + cls.FILE_EXTENSION[sequence_format])
+
+    def Write(self, key, entry):
+        if self.sequence_format == 'JSON':
+            if self.pending is not None and self.pending[0] != key:
+                self.WritePending()
+            self.pending = (key, entry)
+        elif self.sequence_format == 'JSONL':
+            self.f.write(simplejson.dumps({key: entry}) + '\n')
+            self.num_of_entries += 1
         else:
-            return [e.GetDest() for e in self.out_edges]
+            self.f.write('%s:%s\n' % (key, entry))
+            self.num_of_entries += 1
+
+    def WriteInit(self, Time, entry, cells):
+        self.Write('T' + str(Time), entry)
+
+    def WriteGate(self, Time, entry, op, out_cells, in_cells):
+        self.Write('T' + str(Time), entry)
+
+    def WritePending(self):
+        self.f.write('%s\n        %s: %s' % (',' if self.num_of_entries else '', simplejson.dumps(self.pending[0]), simplejson.dumps(self.pending[1])))
+        self.num_of_entries += 1
+
+    def Close(self):
+        if self.sequence_format == 'JSON':
+            if self.pending is not None:
+                self.WritePending()
+            self.f.write('\n    }\n}' if self.num_of_entries else '}\n}')
+        self.f.close()
+
+# A decoded microcode instruction. op is an opcode table entry (MICROCODE_INIT_OP for initializations), outs/ins are
+# cell numbers (None for an input that is not mapped), and init_cells the cells an initialization resets
+Microcode = namedtuple('Microcode', ['time', 'op', 'outs', 'ins', 'init_cells'])
+
+MICROCODE_MAGIC = b'SMPLRMC1'
+MICROCODE_VERSION = 1
+MICROCODE_INIT_OP = 'Initialization(Ron)'
+MICROCODE_NO_CELL = 0xFFFFFFFF
+# magic, version, record size, max outputs, max inputs, number of instructions, meta length, records offset, pool offset, pool length (cells)
+MICROCODE_HEADER = struct.Struct('<8sHHHHIIIII')
+# time, opcode id, number of outputs, number of inputs, pool index and number of the init cells (then the output and input cells)
+MICROCODE_RECORD_PREFIX = '<IHBBII'
+
+class MicrocodeWriter:
+    #Streams the execution sequence into the fixed width binary microcode format, read by MicrocodeReader:
+    #   header - MICROCODE_HEADER, then the meta data JSON (opcode table, input/output cell maps, benchmark data)
+    #   records - an instruction per record, all of the same size (4 byte aligned)
+    #   pool - the uint32 init cell lists of the initialization records
+    #The pool is spilled into a temporary file while the records are written, and appended when closing.
+
+    BUFFER_SIZE = 1 << 20
+
+    def __init__(self, path, header, input_cells, output_cells, max_ins):
+        self.opcodes = [MICROCODE_INIT_OP] + sorted(GATE_TIME.keys())
+        self.opcode_ids = dict((op, op_id) for op_id, op in enumerate(self.opcodes))
+        self.max_outs = max(GATE_NUM_OF_OUTS.values())
+        self.max_ins = max_ins
+        self.record = struct.Struct(MICROCODE_RECORD_PREFIX + 'I' * (self.max_outs + self.max_ins))
+        meta = OrderedDict(header)
+        meta['Opcodes'] = self.opcodes
+        meta['Input cells'] = input_cells
+        meta['Output cells'] = output_cells
+        meta = simplejson.dumps(meta).encode()
+        self.meta_len = len(meta)
+        meta += b' ' * (-(MICROCODE_HEADER.size + len(meta)) % 4)
+        self.records_offset = MICROCODE_HEADER.size + len(meta)
+        self.f = open(path, 'wb', buffering=self.BUFFER_SIZE)
+        self.f.write(MICROCODE_HEADER.pack(MICROCODE_MAGIC, MICROCODE_VERSION, self.record.size, self.max_outs, self.max_ins, 0, self.meta_len, self.records_offset, 0, 0))
+        self.f.write(meta)
+        self.pool = tempfile.TemporaryFile()
+        self.pool_len = 0
+        self.num_of_instructions = 0
+        self.padding = [0] * (self.max_outs + self.max_ins)
 
-    def GetInEdgesList(self,TrueDepFlag):
-        if TrueDepFlag:
-            L = [e.GetSource() for e in self.in_edges if e.GetVal()==1]
-            L.reverse()
-            return L
+    @classmethod
+    def FileName(cls, RowSize, Benchmark):
+        directory, name = os.path.split(Benchmark)
+        return os.path.join(directory, 'MC_' + str(RowSize) + '_' + name + '.bin')
+
+    def WriteInit(self, Time, entry, cells):
+        self.f.write(self.record.pack(Time, 0, 0, 0, self.pool_len, len(cells), *self.padding))
+        self.pool.write(array('I', cells).tobytes() if sys.byteorder == 'little' else struct.pack('<%dI' % len(cells), *cells))
+        self.pool_len += len(cells)
+        self.num_of_instructions += 1
+
+    def WriteGate(self, Time, entry, op, out_cells, in_cells):
+        cells = list(out_cells) + [0] * (self.max_outs - len(out_cells))
+        cells += [MICROCODE_NO_CELL if cell is None else int(cell) for cell in in_cells] + [0] * (self.max_ins - len(in_cells))
+        self.f.write(self.record.pack(Time, self.opcode_ids[op], len(out_cells), len(in_cells), 0, 0, *cells))
+        self.num_of_instructions += 1
+
+    def Close(self):
+        pool_offset = self.records_offset + self.num_of_instructions * self.record.size
+        self.pool.seek(0)
+        shutil.copyfileobj(self.pool, self.f)
+        self.pool.close()
+        self.f.seek(0)
+        self.f.write(MICROCODE_HEADER.pack(MICROCODE_MAGIC, MICROCODE_VERSION, self.record.size, self.max_outs, self.max_ins, self.num_of_instructions, self.meta_len, self.records_offset, pool_offset, self.pool_len))
+        self.f.close()
+
+class MicrocodeProgram:
+    #Collects the execution sequence in memory, as Microcode instructions (the MicrocodeWriter interface, without a file)
+
+    def __init__(self, header, input_cells, output_cells):
+        self.meta = OrderedDict(header)
+        self.meta['Input cells'] = input_cells
+        self.meta['Output cells'] = output_cells
+        self.instructions = []
+
+    def WriteInit(self, Time, entry, cells):
+        self.instructions.append(Microcode(Time, MICROCODE_INIT_OP, (), (), list(cells)))
+
+    def WriteGate(self, Time, entry, op, out_cells, in_cells):
+        self.instructions.append(Microcode(Time, op, tuple(out_cells), tuple(None if cell is None else int(cell) for cell in in_cells), []))
+
+    def Close(self):
+        pass
+
+    def __len__(self):
+        return len(self.instructions)
+
+    def __iter__(self):
+        return iter(self.instructions)
+
+class MicrocodeReader:
+    #Zero copy reader of a MicrocodeWriter file: the file is memory mapped, and the instructions are decoded one at
+    #a time, on access (reader[i], or iteration). The init cell lists are memoryview slices of the mapped pool.
+    #Use as a context manager, or call Close(), to unmap the file.
+
+    def __init__(self, path):
+        with open(path, 'rb') as f:
+            self.mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        self.view = memoryview(self.mm)
+        (magic, version, record_size, self.max_outs, self.max_ins, self.num_of_instructions, meta_len,
+         self.records_offset, pool_offset, pool_len) = MICROCODE_HEADER.unpack_from(self.mm, 0)
+        if magic != MICROCODE_MAGIC or version != MICROCODE_VERSION:
+            raise ValueError("%s is not a version %d SIMPLER microcode file" % (path, MICROCODE_VERSION))
+        self.record = struct.Struct(MICROCODE_RECORD_PREFIX + 'I' * (self.max_outs + self.max_ins))
+        if self.record.size != record_size:
+            raise ValueError("%s has a corrupted header" % path)
+        self.meta = simplejson.loads(bytes(self.view[MICROCODE_HEADER.size:MICROCODE_HEADER.size + meta_len]), object_pairs_hook=OrderedDict)
+        self.opcodes = self.meta['Opcodes']
+        pool = self.view[pool_offset:pool_offset + 4 * pool_len]
+        self.pool = pool.cast('I') if sys.byteorder == 'little' and array('I').itemsize == 4 else array('I', struct.unpack('<%dI' % pool_len, pool))
+
+    def __len__(self):
+        return self.num_of_instructions
+
+    def Decode(self, fields):
+        Time, op_id, num_of_outs, num_of_ins, pool_idx, pool_count = fields[:6]
+        outs = fields[6:6 + num_of_outs]
+        ins = tuple(None if cell == MICROCODE_NO_CELL else cell for cell in fields[6 + self.max_outs:6 + self.max_outs + num_of_ins])
+        return Microcode(Time, self.opcodes[op_id], outs, ins, self.pool[pool_idx:pool_idx + pool_count])
+
+    def __getitem__(self, idx):
+        if idx < 0:
+            idx += self.num_of_instructions
+        if not 0 <= idx < self.num_of_instructions:
+            raise IndexError("microcode instruction index out of range")
+        return self.Decode(self.record.unpack_from(self.mm, self.records_offset + idx * self.record.size))
+
+    def __iter__(self):
+        records = self.view[self.records_offset:self.records_offset + self.num_of_instructions * self.record.size]
+        for fields in self.record.iter_unpack(records):
+            yield self.Decode(fields)
+
+    def Close(self):
+        self.pool = None
+        try:
+            self.view.release()
+            self.mm.close()
+        except BufferError: # init_cells of decoded instructions are still referenced, the file is unmapped when they are freed
+            pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.Close()
+
+class SIMPLER_Netlist:
+    #The parsed netlist: the input/output/wire declarations, the gates and the CSR graph.
+    #It does not depend on the row size and is not changed by the mapping, so a single instance can be shared
+    #by all the SIMPLER_Top_Data_Structure runs (row sizes) of a benchmark.
+    #partition is True for the netlist of a multi-row Partition (see Make_Partition).
+
+    def __init__(self, bmfId, partition=False):
+        self.partition = partition
+        self.InputString = []
+        self.OutputString = []
+        self.WireString = []
+        self.numOfGates = 0
+        
+        # read input/output/wire and the gate declarations in a single scan of the netlist,
+        # unless bmfId is a NetlistModule that is already in memory
+        if isinstance(bmfId, NetlistModule):
+            module = bmfId
         else:
-            return [e.GetSource() for e in self.in_edges]
+            module = NetlistModule(bmfId, getattr(bmfId, 'name', None))
+        gate_decs = [gate for gate in module.gates if gate.cell in GATE_TIME] # As if the module was written and read back
+        self.gates = gate_decs
+        self.InputString = module.declarations['input'][0]
+        self.OutputString = module.declarations['output'][0]
+        self.WireString = module.declarations['wire'][0]
+        # Create a list containing all the outputs of the gates, and a net name -> producing node index.
+        self.gate_outputs = [[i] for i in self.InputString]
+        self.net_to_node = {}
+        for input_idx, input_name in enumerate(self.InputString):
+            self.net_to_node.setdefault(input_name, input_idx)
+        
+        # Map variables to numbers
+        self.varLegendCol = self.WireString + self.OutputString
+        self.varLegendRow = self.InputString + self.WireString + self.OutputString
+        self.len_input_and_wire = len(self.InputString + self.WireString)
+        
+        self.lc = len(self.varLegendCol)   
+        self.i = len(self.InputString)  # number of inputs
+        
+        for gate in gate_decs:
+            self.numOfGates += 1
+            outs = list(gate.pins.values())[-GATE_NUM_OF_OUTS[gate.cell]:]
+            for out in outs: # Multi-output gates (c_ha_, c_hs_) register every output net
+                self.net_to_node.setdefault(out, len(self.gate_outputs))
+            self.gate_outputs.append(outs)
+        
+        self.lr = len(self.InputString) + self.numOfGates
+        # Per gate (gate_number) static data: op, input node indexes, input net names and output net names
+        self.gate_ops = []
+        self.gate_input_idxs = []
+        self.gate_ins = []
+        self.gate_outs = []
+        edge_sources = array('i')
+        edge_dests = array('i')
+        for gate_number, gate in enumerate(gate_decs):
+            op = gate.cell
+            operands = list(gate.pins.values())
+            input_idxs = []
+            for k in range(0,len(operands) - GATE_NUM_OF_OUTS[op]):
+                inIdx = self.net_to_node[operands[k]]
+                if inIdx != gate_number + self.i:
+                    edge_sources.append(inIdx)
+                    edge_dests.append(gate_number + self.i)
+                    input_idxs.append(inIdx) #Gate inputs list
+            self.gate_ops.append(op)
+            self.gate_input_idxs.append(input_idxs)
+            self.gate_ins.append(operands[:-GATE_NUM_OF_OUTS[op]])
+            self.gate_outs.append(operands[-GATE_NUM_OF_OUTS[op]:])
+        self.graph = GraphAdjacency(self.lr,edge_sources,edge_dests,self.i)
+        # The gate nodes of the primary outputs, which must stay in their cells to the end (see IncreaseOutputsFo)
+        self.live_out_nodes = sorted(set(self.net_to_node[net] for net in self.OutputString if self.net_to_node.get(net, 0) >= self.i))
 
 class SIMPLER_Top_Data_Structure:
+    #The mapping state of a single SIMPLER run (one row size).
+    #bmfId is either an open netlist file, a NetlistModule, or a SIMPLER_Netlist that was already parsed (and is shared between runs).
 
     def __init__(self, RowSize, bmfId, Benchmark):
         self.PRINT_WARNING = False
         self.PRINT_CODE_GEN = False
         self.JSON_CODE_GEN = False    
         self.Benchmark = Benchmark
-        self.InputString = []
-        self.OutputString = []
-        self.WireString = []
-        self.varLegendRow = []
-        self.varLegendCol = []
-        self.len_input_and_wire = 0
-        self.lr = 0
-        self.lc = 0   
         self.RowSize = RowSize
         self.NumberOfGates = 0
-        self.NodesList = []
-        self.i = 0
         self.N = RowSize
         self.t = 0 #TotalCycles
         self.ReuseCycles = 0
-        self.LEAFS_inputs = []
         self.NodesList = []
         self.InitializationList = [] #composed of NoedData dummy instances
         self.InitializationPercentage = 0.0
@@ -846,63 +1169,34 @@ class SIMPLER_Top_Data_Structure:
         self.UnConnected_wire = 0
         self.cells = CellsInfo(self.N)
         self.currentIntermediateCells = []
-        self.numOfGates = 0
         self.writes = 0
         
-        # read input/output/wire
-        data = bmfId.read()
-        bmfId.seek(0)
-        self.InputString =  [input.strip() for input in re.findall("input\s+(.*?);", data, re.DOTALL)[0].split(",")]
-        self.OutputString = [output.strip() for output in re.findall("output\s+(.*?);", data, re.DOTALL)[0].split(",")]
-        self.WireString = [wire.strip() for wire in re.findall("wire\s+(.*?);", data, re.DOTALL)[0].split(",")]
-        # Create a list containing all the outputs of the gates.
-        self.gate_outputs = [[i] for i in self.InputString]
-        gate_decs = re.findall("c_.*?;", data, re.DOTALL)
-        
-        # Map variables to numbers
-        self.varLegendCol = self.WireString + self.OutputString
-        self.varLegendRow = self.InputString + self.WireString + self.OutputString
-        self.len_input_and_wire = len(self.InputString + self.WireString)
-        
-        self.lc = len(self.varLegendCol)   
-        self.i = len(self.InputString)  # number of inputs
-        #self.readoperations(bmfId)  # parses the netlist 
-        
-        for dec in gate_decs:
-            for gate_name in GATE_TIME.keys():
-                if gate_name in dec:
-                    op = gate_name
-                    self.numOfGates += 1
-                    operands = [op.strip() for op in re.findall("\..+?\((.+?)\)", dec, re.DOTALL)]
-                    outs = operands[-GATE_NUM_OF_OUTS[gate_name]:]
-                    self.gate_outputs.append(outs)
-                    break
+        if isinstance(bmfId, SIMPLER_Netlist):
+            self.netlist = bmfId
+        else:
+            self.netlist = SIMPLER_Netlist(bmfId)
+        self.InputString = self.netlist.InputString
+        self.OutputString = self.netlist.OutputString
+        self.WireString = self.netlist.WireString
+        self.varLegendRow = self.netlist.varLegendRow
+        self.varLegendCol = self.netlist.varLegendCol
+        self.len_input_and_wire = self.netlist.len_input_and_wire
+        self.lr = self.netlist.lr
+        self.lc = self.netlist.lc
+        self.i = self.netlist.i
+        self.numOfGates = self.netlist.numOfGates
+        self.gate_outputs = self.netlist.gate_outputs
+        self.net_to_node = self.netlist.net_to_node
+        self.graph = self.netlist.graph
         
-        self.lr = len(self.InputString) + self.numOfGates
-        self.NodesList = [NodeData(idx) for idx in range(len(self.InputString) + self.numOfGates)]
-        for input_idx in range(len(self.InputString)):   
+        self.NodesList = [NodeData(idx) for idx in range(self.lr)]
+        for input_idx in range(self.i):   
             self.NodesList[input_idx].InsertInputNode()
             self.NodesList[input_idx].input_list = self.InputString[input_idx]
-        gate_number = 0
-        for dec in gate_decs:
-            for gate_name in GATE_TIME.keys():
-                if gate_name in dec:
-                    op = gate_name
-                    operands = [op.strip() for op in re.findall("\..+?\((.+?)\)", dec, re.DOTALL)]
-                    input_idxs = []
-                    for k in range(0,len(operands) - GATE_NUM_OF_OUTS[op]):
-                        inIdx = [self.gate_outputs.index(l) for l in self.gate_outputs if operands[k] in l][0]
-                        if inIdx != gate_number + self.i:
-                            self.NodesList[inIdx].AddOutEdge(gate_number + self.i,1)
-                            self.NodesList[gate_number + self.i].AddInEdge(inIdx,1)
-                            input_idxs.append(inIdx) #Gate inputs list
-                    ins = operands[:-GATE_NUM_OF_OUTS[gate_name]]
-                    outs = operands[-GATE_NUM_OF_OUTS[gate_name]:]
-                    self.NodesList[gate_number + (len(self.InputString))].output_list = outs
-                    self.NodesList[gate_number + (len(self.InputString))].input_list = ins
-                    self.Insert_readoperations_parameters(gate_number + (len(self.InputString)),input_idxs,op) #For statistics
-                    gate_number += 1                    
-                    break            
+        for gate_number in range(self.numOfGates):
+            self.NodesList[gate_number + self.i].output_list = self.netlist.gate_outs[gate_number]
+            self.NodesList[gate_number + self.i].input_list = self.netlist.gate_ins[gate_number]
+            self.Insert_readoperations_parameters(gate_number + self.i,self.netlist.gate_input_idxs[gate_number],self.netlist.gate_ops[gate_number]) #For statistics
         self.LEAFS_inputs = list(range(self.i)) #Inputs indexes
         
     #Seters/geters:     
@@ -966,8 +1260,10 @@ class SIMPLER_Top_Data_Structure:
         if PRINT_CODE_GEN == True:
             print(Str)
 
-    def PrintCodeGeneration(self):    
-        #Prints the data and the statistics, can create the benchmark's execution sequence JSON file
+    def PrintCodeGeneration(self, sequence_format=None):    
+        #Prints the data and the statistics, can create the benchmark's execution sequence JSON file.
+        #sequence_format overrides JSON_CODE_GEN/SEQUENCE_FORMAT; 'MEMORY' collects the program into a MicrocodeProgram.
+        #Returns the execution sequence writer (None if no sequence was created).
                 
         print('\\\\\\\\\\\\ MAPPING OF',self.Benchmark,'WITH ROW SIZE =',self.RowSize,' \\\\\\\\\\\\\n')
         names_to_mapping = OrderedDict()
@@ -988,10 +1284,11 @@ class SIMPLER_Top_Data_Structure:
             #    import pdb;pdb.set_trace()
         mergerd_list = self.NodesList + self.InitializationList
         mergerd_list.sort(key = lambda k: k.GetNodeTime(), reverse=False) #Sorts by time
+        output_names = set(self.OutputString)
         for node in mergerd_list:
             if node.op in GATE_NUM_OF_OUTS.keys():
                 for i in range(len(node.output_list)):
-                    if node.output_list[i] in self.OutputString:
+                    if node.output_list[i] in output_names:
 
                         outputs[node.output_list[i]] = node.GetNodeMap()[i]
 
@@ -1002,13 +1299,38 @@ class SIMPLER_Top_Data_Structure:
         #execution_dict_for_JSON=OrderedDict({}) #JSON
         # cells_to_init_list = ['INIT_CYCLE(' + str(idx) + ')' for idx in range(self.lr-self.lc,self.lr)]
         cells_to_init_list = ['INIT_CYCLE(' + str(idx) + ')' for idx in range(len(self.InputString), self.lr)]
-        execution_dict_for_JSON=OrderedDict({'T0':'Initialization(Ron)'+ str(cells_to_init_list).replace('[','{').replace(']','}').replace(' ','')}) #JSON
+        sequence_writer = None
+        if sequence_format is None and JSON_CODE_GEN == True:
+            sequence_format = SEQUENCE_FORMAT
+        if sequence_format is not None: #The execution sequence is streamed into the file while it is printed
+            top_JSON_dict=OrderedDict({'Benchmark':self.Benchmark}) #JSON
+            top_JSON_dict.update({'Row size':self.RowSize})
+            top_JSON_dict.update({'Number of Gates':self.numOfGates})
+            top_JSON_dict.update({'Inputs':input_list_for_print[len('Inputs:'):]})
+            top_JSON_dict.update({'Outputs':output_list_for_print[len('Outputs:'):]})
+            top_JSON_dict.update({'Number of Inputs':len(self.InputString)})
+            top_JSON_dict.update({'Total cycles':self.t})
+            top_JSON_dict.update({'Reuse cycles':self.ReuseCycles})
+            input_cells = OrderedDict((name, int(cell)) for name, cell in names_to_mapping.items())
+            if sequence_format == 'MEMORY':
+                sequence_writer = MicrocodeProgram(top_JSON_dict, input_cells, outputs)
+            elif sequence_format == 'BINARY':
+                sequence_writer = MicrocodeWriter(MicrocodeWriter.FileName(self.RowSize, self.Benchmark), top_JSON_dict, input_cells, outputs, max([len(ins) for ins in self.netlist.gate_ins], default=0))
+            else:
+                sequence_writer = ExecutionSequenceWriter(ExecutionSequenceWriter.FileName(sequence_format, self.RowSize, self.Benchmark), sequence_format, top_JSON_dict)
+            sequence_writer.WriteInit(0, 'Initialization(Ron)'+ str(cells_to_init_list).replace('[','{').replace(']','}').replace(' ',''), range(len(self.InputString), self.lr))
         self.Intrl_Print('\nEXECUTION SEQUENCE + MAPPING: {')
         
         for node in mergerd_list:
             for i in range(len(node.output_list)):
                 names_to_mapping[node.output_list[i]] = node.GetNodeMap()[i]
         
+        # Reverse index: cell -> the names mapped to it, in names_to_mapping order. An initialized cell releases
+        # the first of them that is still live (as a linear search of names_to_mapping by value would find)
+        mapping_to_names = {}
+        for name, cell in names_to_mapping.items():
+            mapping_to_names.setdefault(cell, deque()).append(name)
+        
         # Merge pairs of gates
         prev_op_name = None
         prev_gate_paired = False
@@ -1032,7 +1354,7 @@ class SIMPLER_Top_Data_Structure:
                 init_list_to_print = '{'
                 for pair in node.GetNodeInputs_list(): #in a case of Initialization, inputs_list composed of [gate_number,cell_number] elements
                     if pair[0] is not None:
-                        gate_name = list(names_to_mapping.keys())[list(names_to_mapping.values()).index(pair[1])]
+                        gate_name = mapping_to_names[pair[1]].popleft()
                         
                         names_to_mapping.pop(gate_name)                        
                     else:
@@ -1040,11 +1362,13 @@ class SIMPLER_Top_Data_Structure:
                     init_list_to_print += gate_name + '(' + str(pair[1]) + '),'
                 init_list_to_print = init_list_to_print[:len(init_list_to_print) - 1] + '}' 
                 self.Intrl_Print('T' + str(node.GetNodeTime()) + ':Initialization(Ron)' +  init_list_to_print)
-                execution_dict_for_JSON.update({'T' + str(node.GetNodeTime()) : 'Initialization(Ron)' +  init_list_to_print})  #JSON 
+                if sequence_writer is not None:
+                    sequence_writer.WriteInit(node.GetNodeTime(), 'Initialization(Ron)' +  init_list_to_print, [pair[1] for pair in node.GetNodeInputs_list()])  #JSON 
             else:
                 node_name = node.output_list
                 if (node.GetNodeTime() != 0): #not an input
                     inputs_str = ''
+                    input_cells = []
                     for i in range(len(node.GetNodeInputs_list())):
                         #inputs_str = inputs_str + self.varLegendRow[Input] + '(' + str(self.NodesList[Input].GetNodeMap()) + ')' + ','
                         #inputs_str = inputs_str + node.input_list[i] + '(' + str(self.NodesList[node.GetNodeInputs_list()[i]].GetNodeMap()) + ')' + ','
@@ -1054,11 +1378,13 @@ class SIMPLER_Top_Data_Structure:
                         else:
                             map = names_to_mapping[node.input_list[i]]
                         inputs_str = inputs_str + node.input_list[i] + '(' + str(map) + ')' + ','
+                        input_cells.append(map)
                         
                     inputs_str = '{' + inputs_str[:len(inputs_str) - 1] + '}'
                     
                     self.Intrl_Print('T' + str(node.GetNodeTime()) + ':' + ",".join(["%s(%d)" % (node_name[i], node.GetNodeMap()[i]) for i in range(len(node_name))]) +'=' + node.GetNodeOp() + inputs_str + ', Int. cells: %s' % str(node.intermediateCells))
-                    execution_dict_for_JSON.update({'T' + str(node.GetNodeTime()) : str(node_name) + '(' + ",".join([str(n) for n in node.GetNodeMap()]) +')=' + node.GetNodeOp() + inputs_str}) #JSON
+                    if sequence_writer is not None:
+                        sequence_writer.WriteGate(node.GetNodeTime(), str(node_name) + '(' + ",".join([str(n) for n in node.GetNodeMap()]) +')=' + node.GetNodeOp() + inputs_str, node.GetNodeOp(), node.GetNodeMap(), input_cells) #JSON
                     
                     if node.GetNodeOp() == prev_op_name and not prev_gate_paired:
                         time_pairs -= GATE_TIME[node.GetNodeOp()]
@@ -1080,6 +1406,8 @@ class SIMPLER_Top_Data_Structure:
                     self.Intrl_Print('T' + str(node.GetNodeTime()) + ':' + str(node.input_list) + '(' + str(node.GetNodeNum()) +')=' + node.GetNodeOp())    
                     #execution_dict_for_JSON.update({'T' + str(node.GetNodeTime()) : node_name + '(' + str(node.GetNodeMap()) +')=' + node.GetNodeOp()}) #JSON                    
         self.Intrl_Print('}')         
+        if sequence_writer is not None:
+            sequence_writer.Close()
         
         #Statistics
         print ('\nRESULTS AND STATISTICS:')
@@ -1091,7 +1419,7 @@ class SIMPLER_Top_Data_Structure:
         print ('Initialization percentage:',self.InitializationPercentage)
         print ('Number of gates:', self.numOfGates)
         print ('Number of gates pairs:', numOfGates_pairs)
-        #print ('Max number of used cells:',self.Max_Num_Of_Used_Cells)
+        print ('Max number of used cells:',self.Max_Num_Of_Used_Cells)
         print ('Number of writes:',self.writes)
         print ('Row size (number of columns):',self.RowSize)
         print ('Number of used cells:', len(set(list(itertools.chain(*[node.GetNodeMap() for node in mergerd_list[len(self.InputString):]]))).union(set(list(itertools.chain(*[node.intermediateCells for node in mergerd_list[len(self.InputString):]]))))))
@@ -1121,23 +1449,8 @@ class SIMPLER_Top_Data_Structure:
         print ('E = ', E)
         
         print ('I = ', I)
+        return sequence_writer
         
-        #JSON creation
-        if (JSON_CODE_GEN == True):
-            top_JSON_dict=OrderedDict({'Benchmark':self.Benchmark}) #JSON
-            top_JSON_dict.update({'Row size':self.RowSize})
-            top_JSON_dict.update({'Number of Gates':connected_gates})
-            top_JSON_dict.update({'Inputs':input_list_for_print[len('Inputs:'):]})
-            top_JSON_dict.update({'Outputs':output_list_for_print[len('Outputs:'):]})
-            top_JSON_dict.update({'Number of Inputs':len(self.InputString)})
-            top_JSON_dict.update({'Total cycles':self.t})
-            top_JSON_dict.update({'Reuse cycles':self.ReuseCycles})
-            top_JSON_dict.update({'Execution sequence' : execution_dict_for_JSON})
-            #print('Benchmark= ',Benchmark)                             
-            with open('JSON_' + str(self.RowSize) + '_' + self.Benchmark + '.json','w') as f:
-                simplejson.dump(top_JSON_dict,f,indent=4)
-            f.close()                
-
 
     def PrintLines(self):
         for line in self.code_generation_table:
@@ -1162,81 +1475,14 @@ class SIMPLER_Top_Data_Structure:
         return  list(filter(None,FieldString))
 
 
-    def readoperations(self,bmfId):
-        #Parses the netlist assignments into a graph (matrix) 
-
-        global code_generation_top,PRINT_WARNING 
-        
-        tline = bmfId.readline()
-        gate_number = -1
-        while isinstance(tline,str):
-            operands = []
-            # Find gate number
-            if tline.find('//') != -1: #Ignore comment lines at operands part
-                tline = tline[0:tline.find('//')]
-            if (tline.find("endmodule") != -1):
-                return 
-            elif ((tline.find("buf ") != -1) or (tline.find("zero ") != -1) or (tline.find("one ") != -1)):
-                if (PRINT_WARNING == True):
-                    print("** Warning ** unsupported operation: \'" + tline.replace('\n','') + "\'\n")
-            elif any(gate in tline for gate in GATE_NUM_OF_OUTS.keys()): 
-                for gate in GATE_NUM_OF_OUTS.keys():
-                    if gate in tline:
-                        op = gate
-                        gate_number = gate_number + 1
-                        break
-                #idx_op = tline.find("nor")
-                #if (idx_op != -1):
-                #    op = tline[idx_op:idx_op + len('nor') + 1] #op = "nor(#inputs)"
-                #else:
-                #    op = 'inv1' 
-                
-                
-                
-                remain = tline
-                num_of_op = 0
-                while (remain.find('.') != -1):
-                    remain = remain[remain.find('.'):]
-                    remain = remain[remain.find('(') + 1:]
-                    open_bracket_idx = remain.find('(')
-                    close_bracket_idx = remain.find(')')
-                    #Gets the operands
-                    if (open_bracket_idx != -1) and (open_bracket_idx < close_bracket_idx):
-                        second_close_bracket_idx = remain.find(')',close_bracket_idx + 1)
-                        operand = remain[0:second_close_bracket_idx].replace(' ','').replace('\t','')
-                        operands.append(operand)
-                    else:
-                        operand = remain[0:close_bracket_idx].replace(' ','').replace('\t','')
-                        operands.append(operand)
-                    # operands_dict[operand] = gate_number + self.i
-                    num_of_op += 1
-                    #out = operands[num_of_op - 1] #Gets the output operand
-                outs = operands[num_of_op - GATE_NUM_OF_OUTS[op] : num_of_op]
-                ins = operands[0 : num_of_op - GATE_NUM_OF_OUTS[op]]
-                #for out in outs:
-                input_idxs = []
-                for k in range(0,num_of_op - GATE_NUM_OF_OUTS[op]):
-                # for k in range(0,num_of_op):
-                    inIdx = [self.gate_outputs.index(l) for l in self.gate_outputs if operands[k] in l][0]
-                    # inIdx = self.gate_outputs.index(operands[k])
-                    # inIdx = operands_dict[operands[k]]
-                    self.NodesList[inIdx].AddOutEdge(gate_number + self.i,1) #TODO - remove self.i
-                    self.NodesList[gate_number + self.i].AddInEdge(inIdx,1)
-                    input_idxs.append(inIdx) #Gate inputs list
-                # self.Insert_readoperations_parameters(outIdx + (self.lr -self.lc),input_idxs,op) #For statistics    
-                self.NodesList[gate_number + (len(self.InputString))].output_list = outs
-                self.NodesList[gate_number + (len(self.InputString))].input_list = ins
-                self.Insert_readoperations_parameters(gate_number + (len(self.InputString)),input_idxs,op) #For statistics      
-            tline = bmfId.readline()            
-
     def GetRoots_list(self): 
         #Returns the graph roots. Also calculates the FO array.
         
         roots = []
         for i,node in enumerate(self.NodesList):
-            row_sum = node.GetNumOfOutEdges()
+            row_sum = self.graph.GetNumOfFanout(i)
             if (row_sum == 0):
-                if ((node.GetNumOfInEdges()) != 0):
+                if (self.graph.GetNumOfFanin(i) != 0):
                     roots.append(i)
                 else:
                     if (PRINT_WARNING == True):
@@ -1249,47 +1495,73 @@ class SIMPLER_Top_Data_Structure:
         return roots    
 
     def GetParents_list(self,V_i):
-        return self.NodesList[V_i].GetOutEdgesList(True)
+        return list(self.graph.GetFanout(V_i))
 
     def GetChildrens_list(self,V_i): 
-        return self.NodesList[V_i].GetInEdgesList(True)
+        return list(reversed(self.graph.GetFanin(V_i)))
     
     def ChildrenWithoutInputs_list(self,V_i):
-        #Returns the childrens without netlist inputs
-    
-        childrens = self.GetChildrens_list(V_i)
-        childrens_without_inputs = [child for child in childrens if (child in self.LEAFS_inputs) == False]
-        return childrens_without_inputs
-
-    def computeCU(self,V_i):
-        #Computes the cell usage (CU) of gate (node) V_i  
-        if (self.NodesList[V_i].GetNodeCu() > 0):
-            return # CU[V_i] was already generated and therefore doesn't change   
-        childrens = self.ChildrenWithoutInputs_list(V_i)
-        if(len(childrens) == 0): #V_i has no childrens -> V_i is connected to function inputs only
-            #self.NodesList[V_i].SetNodeCu(1)
-            self.NodesList[V_i].SetNodeCu(GATE_INTERMEDIATE_CALC_CELLS[self.NodesList[V_i].op] + GATE_NUM_OF_OUTS[self.NodesList[V_i].op])
-        else:
-            if (len(childrens) == 1):
-                self.computeCU(childrens[0])
-                tmp = self.NodesList[childrens[0]].GetNodeCu()
-                self.NodesList[V_i].SetNodeCu(tmp)
+        #Returns the childrens without netlist inputs (a precomputed slice of the CSR graph)
+        return self.graph.GetChildrenWithoutInputs(V_i)
+
+    def computeCU(self):
+        #Computes the cell usage (CU) of all the gates in a single pass over the levelized graph.
+        #Children are visited before their parents, so no recursion is needed.
+        for V_i in self.graph.GetLevelizedNodes():
+            if self.graph.GetNumOfFanin(V_i) == 0 and self.graph.GetNumOfFanout(V_i) == 0:
+                continue # A gate/wire without inputs is not part of any root's sub-tree
+            childrens = self.ChildrenWithoutInputs_list(V_i)
+            if(len(childrens) == 0): #V_i has no childrens -> V_i is connected to function inputs only
+                self.NodesList[V_i].SetNodeCu(GATE_INTERMEDIATE_CALC_CELLS[self.NodesList[V_i].op] + GATE_NUM_OF_OUTS[self.NodesList[V_i].op])
+            elif (len(childrens) == 1):
+                self.NodesList[V_i].SetNodeCu(self.NodesList[childrens[0]].GetNodeCu())
             else:
-                childrens_cu = []
-                for child in childrens:
-                    self.computeCU(child)
-                    childrens_cu.append(self.NodesList[child].GetNodeCu())
-                childrens_cu.sort(key=None, reverse=True)               
-                num_of_childrens = range(0,len(childrens)) # equal to + (i - 1) for all i in 1 to N (N is the number of childrens)
-                added_l = []
-                for i in range(len(childrens_cu)):
-                    added_l.append(childrens_cu[i]+num_of_childrens[i])
-                #self.NodesList[V_i].SetNodeCu(max(np.add(childrens_cu,num_of_childrens)))
-                self.NodesList[V_i].SetNodeCu(max(added_l))
-            
+                childrens_cu = [self.NodesList[child].GetNodeCu() for child in childrens]
+                childrens_cu.sort(reverse=True)
+                # equal to + (i - 1) for all i in 1 to N (N is the number of childrens)
+                self.NodesList[V_i].SetNodeCu(max(cu + i for i,cu in enumerate(childrens_cu)))
+
+    def SortChildrenByCU(self):
+        #Sorts the childrens of every gate by CU (descending, stable) once, after computeCU.
+        #Row V_i is children_by_cu_idx[children_ptr[V_i]:children_ptr[V_i+1]] (same offsets as the CSR children rows)
+        self.children_by_cu_idx = array('i')
+        for V_i in range(self.lr):
+            childrens = self.ChildrenWithoutInputs_list(V_i)
+            self.children_by_cu_idx.extend(sorted(childrens, key=lambda child: self.NodesList[child].GetNodeCu(), reverse=True))
+
+    def ChildrenSortedByCU_list(self,V_i):
+        return self.children_by_cu_idx[self.graph.children_ptr[V_i]:self.graph.children_ptr[V_i+1]]
 
     def AllocateRow(self,V_i):
         #Allocates cells to the gate V_i and his children (a sub-tree rooted by V_i). 
+        #Visits the sub-tree in the same order as AllocateRow_Recursive, using an explicit stack of
+        #[gate, position in its CU sorted childrens row] frames instead of the call stack.
+        #In a case the allocation for one of V_i's children or V_i itself is failed, the function returns False. On successful allocation returns True.
+        children_ptr = self.graph.children_ptr
+        children_by_cu = self.children_by_cu_idx
+        stack = [V_i]
+        positions = [children_ptr[V_i]]
+        while stack:
+            V_j = stack[-1]
+            pos = positions[-1]
+            end = children_ptr[V_j+1]
+            while pos < end and self.NodesList[children_by_cu[pos]].GetNodeMap() != []: #skip mapped childrens
+                pos += 1
+            if pos < end: #descend into the next unmapped child
+                positions[-1] = pos + 1
+                V_k = children_by_cu[pos]
+                stack.append(V_k)
+                positions.append(children_ptr[V_k])
+                continue
+            stack.pop()
+            positions.pop()
+            if (self.NodesList[V_j].GetNodeMap() == []): #V_j is not mapped
+                if (self.AllocateGate(V_j) == False):
+                    return False
+        return True
+
+    def AllocateRow_Recursive(self,V_i):
+        #The original recursive SIMPLER allocation, kept as a reference for AllocateRow.
         #In a case the allocation for one of V_i's children or V_i itself is failed, the function returns False. On successful allocation returns True.
         childrens = self.ChildrenWithoutInputs_list(V_i) #Equal to C(V_i) - the set of V_i's childrens
         childrens_sorted_by_cu = [[child,self.NodesList[child].GetNodeCu()] for child in childrens] # the loop creates a list composed of pairs of the form [child number, CU[child number]]
@@ -1297,37 +1569,94 @@ class SIMPLER_Top_Data_Structure:
         childrens_sorted_by_cu = [elm[0] for elm in childrens_sorted_by_cu] #taking only the child (vertex) number       
         for V_j in childrens_sorted_by_cu:            
             if (self.NodesList[V_j].GetNodeMap() == []):
-                if (self.AllocateRow(V_j) == False):
+                if (self.AllocateRow_Recursive(V_j) == False):
                     return False
         if (self.NodesList[V_i].GetNodeMap() == []): #V_i is not mapped
-            
-            intermediateCells = []
-            first = True
-            for i in range(GATE_INTERMEDIATE_CALC_CELLS[self.NodesList[V_i].op]): # Add intermediate calculation cells
-                cell = self.AllocateCell(0, first)
-                self.writes += 1
-                if cell == 0:
-                    return False
-                intermediateCells.append(cell)
-            
-            nodeMap = []
-            # print("op=%s, V_i=%d, self.t++, self.t=%d" % (self.NodesList[V_i].op,V_i, self.t))
-            first = True
-            for i in range(GATE_NUM_OF_OUTS[self.NodesList[V_i].op]):
-                cell = self.AllocateCell(V_i, first)
-                self.writes += 1
-                first = False
-                if cell == 0:
-                    return False
-                nodeMap.append(cell)
-            self.NodesList[V_i].SetNodeMap(nodeMap)
-            if len(intermediateCells) != 0:
-                self.NodesList[V_i].intermediateCells = intermediateCells
-                self.currentIntermediateCells += [[None, cell] for cell in intermediateCells]
-            for cell in intermediateCells:
-                self.cells.Insert_Init(cell)
-            # print("V_i=%d, self.t+=%d, self.t=%d" % (V_i, GATE_TIME[self.NodesList[V_i].op] - 1, self.t))
-            self.t += GATE_TIME[self.NodesList[V_i].op] - 1
+            return self.AllocateGate(V_i)
+        return True
+
+    def ListPriority(self,V_i,allocation_order):
+        #The priority of a ready gate in AllocateList (smaller is first): the most childrens it releases (childrens it
+        #is the last unmapped parent of), then the smallest CU, then the oldest live value it reads, then the gate number
+        childrens = self.ChildrenWithoutInputs_list(V_i)
+        edges = {}
+        for V_k in childrens:
+            edges[V_k] = edges.get(V_k, 0) + 1
+        released = sum(1 for V_k, n in edges.items() if self.NodesList[V_k].GetNodeFO() == n)
+        oldest = min([allocation_order[V_k] for V_k in edges], default=self.lr)
+        return (-released, self.NodesList[V_i].GetNodeCu(), oldest, V_i)
+
+    def AllocateList(self,ROOTs):
+        #List scheduling alternative to AllocateRow: allocates all the roots' sub-trees out of a single ready list,
+        #a heap of the gates whose childrens are mapped, ordered by ListPriority. The priority of a ready gate only
+        #changes when one of its childrens is left with a single parent, and the gate is then pushed again (the stale
+        #heap entries are skipped). Same allocation as AllocateRow per gate (AllocateGate).
+        #In a case the allocation of a gate is failed, the function returns False. On successful allocation returns True.
+        pending = {} #gate -> number of its unmapped childrens (edges), for the sub-trees gates
+        stack = list(ROOTs)
+        while stack:
+            V_j = stack.pop()
+            if V_j in pending:
+                continue
+            childrens = self.ChildrenWithoutInputs_list(V_j)
+            pending[V_j] = len(childrens)
+            stack.extend(childrens)
+        allocation_order = {}
+        ready = [(self.ListPriority(V_j, allocation_order), V_j) for V_j, n in pending.items() if n == 0]
+        heapq.heapify(ready)
+        while ready:
+            priority, V_j = heapq.heappop(ready)
+            if V_j in allocation_order:
+                continue
+            current = self.ListPriority(V_j, allocation_order)
+            if current != priority: #stale entry
+                heapq.heappush(ready, (current, V_j))
+                continue
+            if (self.AllocateGate(V_j) == False):
+                return False
+            allocation_order[V_j] = len(allocation_order)
+            for V_k in set(self.ChildrenWithoutInputs_list(V_j)):
+                if self.NodesList[V_k].GetNodeFO() == 1: #its last parent releases it now
+                    for V_p in self.graph.GetFanout(V_k):
+                        if pending.get(V_p) == 0 and V_p not in allocation_order:
+                            heapq.heappush(ready, (self.ListPriority(V_p, allocation_order), V_p))
+            for V_p in self.graph.GetFanout(V_j):
+                if V_p in pending:
+                    pending[V_p] -= 1
+                    if pending[V_p] == 0:
+                        heapq.heappush(ready, (self.ListPriority(V_p, allocation_order), V_p))
+        return True
+
+    def AllocateGate(self,V_i):
+        #Allocates the intermediate and output cells of the gate V_i, whose childrens are already mapped.
+        #Returns False if there are not enough cells.
+        intermediateCells = []
+        for i in range(GATE_INTERMEDIATE_CALC_CELLS[self.NodesList[V_i].op]): # Add intermediate calculation cells
+            cell = self.AllocateCell(0, False)
+            self.writes += 1
+            if cell == 0:
+                return False
+            intermediateCells.append(cell)
+        
+        nodeMap = []
+        # print("op=%s, V_i=%d, self.t++, self.t=%d" % (self.NodesList[V_i].op,V_i, self.t))
+        # The gate cycle and the release of its childrens come with its last output cell, so an initialization
+        # that is needed for another output cell takes its own cycle and cannot reset the gate's inputs
+        num_of_outs = GATE_NUM_OF_OUTS[self.NodesList[V_i].op]
+        for i in range(num_of_outs):
+            cell = self.AllocateCell(V_i, i == num_of_outs - 1)
+            self.writes += 1
+            if cell == 0:
+                return False
+            nodeMap.append(cell)
+        self.NodesList[V_i].SetNodeMap(nodeMap)
+        if len(intermediateCells) != 0:
+            self.NodesList[V_i].intermediateCells = intermediateCells
+            self.currentIntermediateCells += [[None, cell] for cell in intermediateCells]
+        for cell in intermediateCells:
+            self.cells.Insert_Init(cell)
+        # print("V_i=%d, self.t+=%d, self.t=%d" % (V_i, GATE_TIME[self.NodesList[V_i].op] - 1, self.t))
+        self.t += GATE_TIME[self.NodesList[V_i].op] - 1
         return True
 
     # def AllocateCell(self,V_i):
@@ -1357,12 +1686,13 @@ class SIMPLER_Top_Data_Structure:
         # return FreeCell
 
     
-    def AllocateCell(self,V_i,first):
+    def AllocateCell(self,V_i,last):
+        #Allocates a cell, initializing the init list cells (in a cycle of their own) if none is available.
+        #For a gate (V_i != 0), last marks its last output cell: the gate cycle starts and its childrens are released.
         FreeCell = self.cells.GetFirst_Available()
         if FreeCell == None:
             if self.cells.IsNotEmpty_Init():
-                if first:
-                    self.t += 1
+                self.t += 1
                 self.cells.init_list_for_json += self.currentIntermediateCells
                 self.currentIntermediateCells = []
                 self.Add_To_Initialization_List(self.t, self.cells.init_list_for_json)
@@ -1375,7 +1705,7 @@ class SIMPLER_Top_Data_Structure:
         if (V_i != 0):
             
             self.cells.Insert_Used(FreeCell,V_i)
-            if first:
+            if last:
                 self.t += 1
                 for V_k in self.ChildrenWithoutInputs_list(V_i):
                     #if "n9807" in self.NodesList[V_k].output_list:
@@ -1395,12 +1725,19 @@ class SIMPLER_Top_Data_Structure:
     def IncreaseOutputsFo(self):
         # This function created to make sure outputs cells will not evacuated.
         #It is done by increasing their FO by 1
-
-        for idx in range(self.len_input_and_wire,self.lr): #outputs idx range
+        #The index range assumes the output gates are the last ones, which the fusion passes do not keep, so the
+        #nodes that produce the outputs (live_out_nodes) are increased too. The gates of a partition are in the
+        #Partition_Order, so there the range would pin unrelated gates and only live_out_nodes are increased.
+
+        if not self.netlist.partition:
+            for idx in range(self.len_input_and_wire,self.lr): #outputs idx range
+                self.NodesList[idx].SetNodeFO(self.NodesList[idx].GetNodeFO() + 1)
+        for idx in self.netlist.live_out_nodes:
             self.NodesList[idx].SetNodeFO(self.NodesList[idx].GetNodeFO() + 1)
             
             
-    def RunAlgorithm(self):
+    def RunAlgorithm(self, roots_order=None):
+            #roots_order is an explicit order of the roots to allocate (see Search_Root_Order), instead of SORT_ROOTS
             #================ SIMPLER algorithm Starts ================ 
             
             #FO array initialized in __init__
@@ -1417,11 +1754,25 @@ class SIMPLER_Top_Data_Structure:
                 self.cells.Insert_Available(cell) 
             #alg start here
             t1 = time.time()#time
-            for r in ROOTs:
-                self.computeCU(r)
-            if SORT_ROOTS == 'NO':
+            self.computeCU()
+            self.SortChildrenByCU()
+            if roots_order is not None:
+                ROOTs = roots_order
+            if ALLOCATION_ENGINE == 'LIST':
+                if (self.AllocateList(ROOTs) == False):
+                    print('\\\\\\\\\\\\ MAPPING OF',self.Benchmark,'WITH ROW SIZE =',self.N,' \\\\\\\\\\\\\n')
+                    print('False - no mapping\n')
+                    return False #Cannot find mapping
+                t2 = time.time()
+                print('time is:',t2-t1)#time
+                return True
+            if ALLOCATION_ENGINE == 'RECURSIVE':
+                AllocateRow = self.AllocateRow_Recursive
+            else:
+                AllocateRow = self.AllocateRow
+            if SORT_ROOTS in ('NO', 'SEARCH') or roots_order is not None:
                 for r in ROOTs:    
-                    if (self.AllocateRow(r) == False):
+                    if (AllocateRow(r) == False):
                         print('\\\\\\\\\\\\ MAPPING OF',self.Benchmark,'WITH ROW SIZE =',self.N,' \\\\\\\\\\\\\n')
                         print('False - no mapping\n')
                         #code_generation_success_flag = False #Printing flag 
@@ -1437,7 +1788,7 @@ class SIMPLER_Top_Data_Structure:
                 elif SORT_ROOTS == 'ASCEND':
                     sorted_ROOTs.sort(key = lambda k: k[1], reverse=False)
                 for sr in sorted_ROOTs:    
-                    if (self.AllocateRow(sr[0]) == False):
+                    if (AllocateRow(sr[0]) == False):
                         print('\\\\\\\\\\\\ MAPPING OF',self.Benchmark,'WITH ROW SIZE =',self.N,' \\\\\\\\\\\\\n')
                         print('False - no mapping\n')
                         return False #cannot find mapping
@@ -1453,135 +1804,840 @@ def chunks(l, n):
         # Create an index range for l of n items:
         yield l[i:i+n]
 
-def mergeGates_HA(syn_output_path):
+#================ Gate fusion =================
+
+# A cell definition in the synopsys_dc.build_cell style: outputs maps every output pin to [function, related pins].
+# time is the number of operations of the cell in the GATE_TIME library (without the initialization cycle), and
+# intermediate_cells the number of cells it needs besides its outputs. Both are None for cells already in the tables.
+CellDef = namedtuple('CellDef', ['name', 'inputs', 'outputs', 'time', 'intermediate_cells'])
+
+def cell_def(name, inputs, outputs, time=None, intermediate_cells=None):
+    if time is not None and intermediate_cells is None:
+        intermediate_cells = time - len(outputs) # Every operation but the outputs writes an intermediate cell
+    return CellDef(name, inputs, OrderedDict(outputs), time, intermediate_cells)
+
+def Liberty_Cell_Defs(cells):
+    #Reads the cell definitions back out of the Liberty text of synopsys_dc.build_cell cells (the CELL_TEMPLATE,
+    #INPUT_TEMPLATE and OUTPUT_TEMPLATE layout): the input pins in order, and every output's function and related pins
+    for text in cells:
+        inputs = []
+        outputs = OrderedDict()
+        for pin in text.split("pin(")[1:]:
+            pin_name = pin[:pin.index(")")]
+            if re.search(r"direction\s*:\s*input", pin):
+                inputs.append(pin_name)
+            else:
+                outputs[pin_name] = [re.search(r'function\s*:\s*"(.*?)"', pin).group(1), re.search(r'related_pin\s*:\s*"(.*?)"', pin).group(1)]
+        yield cell_def(re.search(r"cell\((\w+)\)", text).group(1), inputs, outputs)
+
+# The single output cells of the library, as the fusion engine sees them: the cells of all the synopsys_dc.SETS
+# (the first definition of a cell that several sets define)
+LIBRARY_CELLS = OrderedDict()
+for library_cell in Liberty_Cell_Defs(itertools.chain(*synopsys_dc.SETS)):
+    if len(library_cell.outputs) == 1:
+        LIBRARY_CELLS.setdefault(library_cell.name, library_cell)
+
+# The multi-output cells that fuseGates builds out of single output gates, in matching priority order (the full
+# adder/subtractor first, since their gates include half adder/subtractor patterns).
+# A new fusion is a new entry here: its costs are registered into the GATE tables by Register_Fusion_Cells, when
+# fuseGates is asked to fuse it. The costs of c_fa_ and c_fs_ are their operations in the NOT/NOR model of GATE_TIME:
+#   c_fa_ - 9 NOR2: n1=NOR(A,B) n2=NOR(A,n1) n3=NOR(B,n1) n4=NOR(n2,n3) n5=NOR(n4,C) n6=NOR(n4,n5) n7=NOR(C,n5)
+#           Y1=NOR(n6,n7) Y2=NOR(n1,n5)
+#   c_fs_ - the c_fa_ sequence on (NOT(A), B, C), whose Y1 is then inverted: 2 NOT + 9 NOR2
+FUSION_CELLS = OrderedDict((cell.name, cell) for cell in [
+    cell_def(name="c_fa_", inputs=["A", "B", "C"], outputs={"Y1": ["(A)^(B)^(C)", "A B C"], "Y2": ["((A)&(B))|((C)&((A)^(B)))", "A B C"]}, time=9),
+    cell_def(name="c_fs_", inputs=["A", "B", "C"], outputs={"Y1": ["(A)^(B)^(C)", "A B C"], "Y2": ["((!A)&(B))|((B)&(C))|((C)&(!A))", "A B C"]}, time=11),
+    cell_def(name="c_ha_", inputs=["A", "B"], outputs={"Y1": ["(A)^(B)", "A B"], "Y2": ["(A)&(B)", "A B"]}),
+    cell_def(name="c_hs_", inputs=["A", "B"], outputs={"Y1": ["(A)^(B)", "A B"], "Y2": ["(!A)&(B)", "A B"]}),
+])
+
+def Register_Fusion_Cells(fusion_cells):
+    #Plugs the costs of the fusion cells into GATE_TIME, GATE_INTERMEDIATE_CALC_CELLS and GATE_NUM_OF_OUTS
+    for cell in fusion_cells.values():
+        if not any(related.split() == cell.inputs for function, related in cell.outputs.values()):
+            raise ValueError("fusion cell %s needs an output that depends on all its inputs" % cell.name)
+        if cell.time is None:
+            if GATE_NUM_OF_OUTS.get(cell.name) != len(cell.outputs):
+                raise ValueError("fusion cell %s has no costs and is not in the GATE tables" % cell.name)
+            continue
+        GATE_TIME[cell.name] = cell.time + 1 # Initialization cycle
+        GATE_INTERMEDIATE_CALC_CELLS[cell.name] = cell.intermediate_cells
+        GATE_NUM_OF_OUTS[cell.name] = len(cell.outputs)
+
+def Truth_Table(function, pin_masks, num_of_vars):
+    #Evaluates a build_cell function over num_of_vars variables at once: every pin is bound to the truth table
+    #(bit r of the mask is the pin's value at row r) of the variable it is connected to
+    return eval(function.replace("!", "~"), {"__builtins__": {}}, pin_masks) & ((1 << (1 << num_of_vars)) - 1)
+
+def Var_Masks(num_of_vars):
+    return [sum(1 << row for row in range(1 << num_of_vars) if (row >> var) & 1) for var in range(num_of_vars)]
+
+FUSION_MAX_CUTS = 16 # The cuts kept per net by Net_Cuts (the smallest first)
+
+def Expand_Table(table, leaves, cut):
+    #The truth table over cut (a sorted tuple of nets that contains leaves) of a function whose table is over leaves
+    positions = [cut.index(leaf) for leaf in leaves]
+    expanded = 0
+    for row in range(1 << len(cut)):
+        sub_row = sum(((row >> pos) & 1) << k for k, pos in enumerate(positions))
+        expanded |= ((table >> sub_row) & 1) << row
+    return expanded
+
+def Net_Cuts(drivers, max_leaves):
+    #Enumerates the cuts of the nets: the sets of at most max_leaves nets that a net is a function of, through the
+    #gates of drivers (net -> its single output library gate). Returns net -> [(cut, truth table over the cut)], where
+    #a cut is a sorted tuple of nets and the trivial cut (net,) comes first. A net that no gate of drivers drives
+    #(an input, an output of a multi-output cell) only has its trivial cut.
+    cuts = {}
+    for root in drivers:
+        stack = [root]
+        while stack:
+            net = stack[-1]
+            if net in cuts:
+                stack.pop()
+                continue
+            gate = drivers.get(net)
+            if gate is None:
+                cuts[net] = [((net,), 2)]
+                stack.pop()
+                continue
+            ins = list(gate.pins.values())[:-1]
+            pending = [in_net for in_net in ins if in_net not in cuts]
+            if pending:
+                stack.extend(pending)
+                continue
+            stack.pop()
+            # Combine a cut of every input, the combinations with the same leaves are the same function
+            partials = {(): []}
+            for in_net in ins:
+                extended = {}
+                for leaves, chosen in partials.items():
+                    for cut, table in cuts[in_net]:
+                        union = tuple(sorted(set(leaves).union(cut)))
+                        if len(union) <= max_leaves and union not in extended:
+                            extended[union] = chosen + [(cut, table)]
+                partials = extended
+            function = CELL_FUNCTIONS[gate.cell]
+            net_cuts = []
+            for cut, chosen in partials.items():
+                tables = [Expand_Table(table, in_cut, cut) for in_cut, table in chosen]
+                net_cuts.append((cut, function(*tables)[0] & ((1 << (1 << len(cut))) - 1)))
+            net_cuts.sort(key=lambda cut_table: len(cut_table[0]))
+            cuts[net] = [((net,), 2)] + net_cuts[:FUSION_MAX_CUTS]
+    return cuts
+
+def fuseGates(module, fusion_cells=None):
+    # Replaces groups of single output gates by the multi-output cells of fusion_cells (default FUSION_CELLS), in place.
+    # Every output of a cell is matched to a net whose truth table over a cut of the netlist (Net_Cuts) is the output's
+    # function of the cell inputs, so an output that is built of several gates (e.g. a full adder carry) is found too.
+    # A group is a net matching an output that depends on all the cell inputs, under every assignment of its cut to the
+    # cell inputs, plus a net for every other output on the matching cut subset. The nets are indexed once by their
+    # (cut, truth table), so every other output is found in O(1). The group's cone gates that only feed the group are
+    # removed, and the group is fused only when these gates cost more GATE_TIME than the cell.
+    # The fused gates come first (anchor order), then the rest grouped by cell in first-seen order, as before.
+    if fusion_cells is None:
+        fusion_cells = FUSION_CELLS
+    Register_Fusion_Cells(fusion_cells)
     
-    # Build gate dictionary
-    data = open(syn_output_path, "r").read()
-    gate_decs = re.findall("c_.*?;", data, re.DOTALL)
-    OutputString = [output.strip() for output in re.findall("output\s+(.*?);", data, re.DOTALL)[0].split(",")]
-    InputString = [output.strip() for output in re.findall("input\s+(.*?);", data, re.DOTALL)[0].split(",")]
-    gate_dict = {}
-    gate_dict["c_ha"] = []
-    gate_dict["c_xor2"] = []
-    gate_dict["c_and2"] = []
-    for dec in gate_decs:
-        for gate_name in GATE_TIME.keys():
-            if gate_name in dec:
-                op = gate_name
-                if not op in gate_dict.keys():
-                    gate_dict[op] = [dec]
-                else:
-                    gate_dict[op].append(dec)
+    drivers = OrderedDict() # net -> its single output library gate, in declaration order
+    readers = {} # net -> the gates that read it
+    for gate in module.gates:
+        nets = list(gate.pins.values())
+        num_of_outs = GATE_NUM_OF_OUTS.get(gate.cell, 1)
+        if gate.cell in LIBRARY_CELLS:
+            drivers.setdefault(nets[-1], gate)
+        for net in nets[:-num_of_outs]:
+            readers.setdefault(net, []).append(gate)
+    live_outs = set(itertools.chain(*module.declarations['output']))
+    cuts = Net_Cuts(drivers, max([len(cell.inputs) for cell in fusion_cells.values()], default=0))
+    nets_by_table = {} # (cut, truth table) -> nets, in declaration order
+    for net in drivers:
+        for cut, table in cuts[net][1:]:
+            nets_by_table.setdefault((cut, table), []).append(net)
     
-    # Merge HA gates
-    new_gate_dict = copy.deepcopy(gate_dict)
-    for gate_dec in gate_dict["c_xor2"]:
-        if gate_dec in new_gate_dict["c_xor2"]:
-            operands = [op.strip() for op in re.findall("\..+?\((.+?)\)", gate_dec, re.DOTALL)] 
-            found = False
-            for gate_dec2 in gate_dict["c_and2"]:
-                operands2 = [op.strip() for op in re.findall("\..+?\((.+?)\)", gate_dec2, re.DOTALL)]
-                #if gate_dec2 in new_gate_dict["c_and2"] and operands[0] in operands[:2] and operands[1] in operands[:2] and gate_dec2 != gate_dec:
-                if gate_dec2 in new_gate_dict["c_and2"] and operands[0] in operands2[:2] and operands[1] in operands2[:2]:
-                    y1 = operands[2]
-                    y2 = operands2[2]
-                    new_gate_dict["c_xor2"].remove(gate_dec)
-                    new_gate_dict["c_and2"].remove(gate_dec2)
-                    unit_name = re.findall("U[0-9]+", gate_dec, re.DOTALL)[0]
-                    new_gate_dict["c_ha"].append("c_ha %s ( .A(%s), .B(%s), .Y1(%s), .Y2(%s) );" % (unit_name, operands[0], operands[1], y1, y2))
-                    found = True
-                    break
-    # Create a new netlist
+    removed = set() # the gates that fused cells replace
+    fused_outs = set() # the nets that fused cells drive
     merged = []
-    for l in new_gate_dict.values():
-        merged += l
-    
-    for dec in gate_decs:
-        data = data.replace(dec + "\n", "")  
-    ind = data.find("endmodule")
-    open("syn_output_path2.v", "w").write(data[:ind] + "\nwire zero;\n" + "\n".join(merged).replace("1'b0", "zero") + "\n" + data[ind:])
-
-def mergeGates_HS(syn_output_path):
-    
-    # Build gate dictionary
-    data = open(syn_output_path, "r").read()
-    gate_decs = re.findall("c_.*?;", data, re.DOTALL)
-    OutputString = [output.strip() for output in re.findall("output\s+(.*?);", data, re.DOTALL)[0].split(",")]
-    InputString = [output.strip() for output in re.findall("input\s+(.*?);", data, re.DOTALL)[0].split(",")]
-    gate_dict = {}
-    gate_dict["c_hs"] = []
-    gate_dict["c_xor2"] = []
-    gate_dict["c_bout"] = []
-    for dec in gate_decs:
-        for gate_name in GATE_TIME.keys():
-            if gate_name in dec:
-                op = gate_name
-                if not op in gate_dict.keys():
-                    gate_dict[op] = [dec]
-                else:
-                    gate_dict[op].append(dec)
-    
-    # Merge HA gates
-    new_gate_dict = copy.deepcopy(gate_dict)
-    for gate_dec in gate_dict["c_xor2"]:
-        if gate_dec in new_gate_dict["c_xor2"]:
-            operands = [op.strip() for op in re.findall("\..+?\((.+?)\)", gate_dec, re.DOTALL)] 
-            found = False
-            for gate_dec2 in gate_dict["c_bout"]:
-                operands2 = [op.strip() for op in re.findall("\..+?\((.+?)\)", gate_dec2, re.DOTALL)]
-                #if gate_dec2 in new_gate_dict["c_and2"] and operands[0] in operands[:2] and operands[1] in operands[:2] and gate_dec2 != gate_dec:
-                if gate_dec2 in new_gate_dict["c_bout"] and operands[0] in operands2[:2] and operands[1] in operands2[:2]:
-                    y1 = operands[2]
-                    y2 = operands2[2]
-                    new_gate_dict["c_xor2"].remove(gate_dec)
-                    new_gate_dict["c_bout"].remove(gate_dec2)
-                    unit_name = re.findall("U[0-9]+", gate_dec, re.DOTALL)[0]
-                    new_gate_dict["c_hs"].append("c_hs %s ( .A(%s), .B(%s), .Y1(%s), .Y2(%s) );" % (unit_name, operands[0], operands[1], y1, y2))
-                    found = True
+    for cell in fusion_cells.values():
+        num_of_vars = len(cell.inputs)
+        out_related = [[cell.inputs.index(pin) for pin in related.split()] for function, related in cell.outputs.values()]
+        anchor = [len(related) for related in out_related].index(num_of_vars)
+        # order[j] - the cut position of the cell input j. For every order, the cut positions of every output and its
+        # truth table over them
+        patterns = []
+        for order in itertools.permutations(range(num_of_vars)):
+            outs = []
+            for (function, _), related in zip(cell.outputs.values(), out_related):
+                positions = sorted(order[j] for j in related)
+                masks = Var_Masks(len(positions))
+                pin_masks = dict((pin, 0) for pin in cell.inputs)
+                pin_masks.update((cell.inputs[j], masks[positions.index(order[j])]) for j in related)
+                outs.append((positions, Truth_Table(function, pin_masks, len(positions))))
+            patterns.append((order, outs))
+        
+        for net, gate in drivers.items():
+            if id(gate) in removed or net in fused_outs:
+                continue
+            for cut, table in cuts[net][1:]:
+                if len(cut) != num_of_vars:
+                    continue
+                for order, outs in patterns:
+                    if outs[anchor][1] != table:
+                        continue
+                    out_nets = []
+                    for out, (positions, out_table) in enumerate(outs):
+                        if out == anchor:
+                            out_nets.append(net)
+                            continue
+                        candidates = nets_by_table.get((tuple(cut[pos] for pos in positions), out_table), ())
+                        out_net = next((net2 for net2 in candidates if net2 != net and net2 not in out_nets and net2 not in fused_outs and id(drivers[net2]) not in removed), None)
+                        if out_net is None:
+                            break
+                        out_nets.append(out_net)
+                    if len(out_nets) != len(outs):
+                        continue
+                    # The cone gates between the cut and the outputs, and of them the ones that only feed the group
+                    cone = OrderedDict()
+                    stack = list(out_nets)
+                    while stack:
+                        net2 = stack.pop()
+                        if net2 in cut or id(drivers[net2]) in cone:
+                            continue
+                        cone[id(drivers[net2])] = drivers[net2]
+                        stack.extend(list(drivers[net2].pins.values())[:-1])
+                    if any(gate_id in removed for gate_id in cone):
+                        continue
+                    free = OrderedDict(cone)
+                    changed = True
+                    while changed:
+                        changed = False
+                        for gate_id, gate2 in list(free.items()):
+                            out_net = list(gate2.pins.values())[-1]
+                            if out_net not in out_nets and (out_net in live_outs or any(id(reader) not in free for reader in readers.get(out_net, ()))):
+                                del free[gate_id]
+                                changed = True
+                    if sum(GATE_TIME[gate2.cell] for gate2 in free.values()) <= GATE_TIME[cell.name]:
+                        continue
+                    removed.update(free)
+                    fused_outs.update(out_nets)
+                    pins = OrderedDict((pin, cut[order[j]]) for j, pin in enumerate(cell.inputs))
+                    pins.update(zip(cell.outputs, out_nets))
+                    merged.append(NetlistGate(cell.name, gate.name, pins, "%s %s ( %s );" % (cell.name, gate.name, ", ".join(".%s(%s)" % pin for pin in pins.items()))))
+                    break
+                if net in fused_outs:
                     break
-    # Create a new netlist
-    merged = []
-    for l in new_gate_dict.values():
-        merged += l
     
-    for dec in gate_decs:
-        data = data.replace(dec + "\n", "")    
-    ind = data.find("endmodule")
-    open("syn_output_path3.v", "w").write(data[:ind] + "\n".join(merged) + "\n" + data[ind:])
+    # The nets of the removed gates are gone from the netlist
+    dead_nets = set(list(gate.pins.values())[-1] for gate in module.gates if id(gate) in removed) - fused_outs
+    module.declarations['wire'] = [[net for net in names if net not in dead_nets] for names in module.declarations['wire']]
+    gate_dict = OrderedDict()
+    for gate in module.gates:
+        if id(gate) not in removed:
+            gate_dict.setdefault(gate.cell, []).append(gate)
+    for gates in gate_dict.values():
+        merged += gates
+    module.gates = merged
+
+def tieConstants(module):
+    # Replaces the constant 1'b0 by the "zero" wire, in place
+    gates = []
+    for gate in module.gates:
+        pins = OrderedDict((pin, net.replace("1'b0", "zero")) for pin, net in gate.pins.items())
+        gates.append(gate._replace(pins=pins, text=gate.text.replace("1'b0", "zero")))
+    module.gates = gates
+    module.declarations['wire'].append(['zero'])
+    module.added_statements.append("\nwire zero;")
+
+def mergeGates_HA(syn_output_path, merged_output_path="syn_output_path2.v"):
+    # File to file half adder fusion
+    with open(syn_output_path, "r") as bmfId:
+        module = NetlistModule(bmfId, syn_output_path)
+    tieConstants(module)
+    fuseGates(module, OrderedDict([("c_ha_", FUSION_CELLS["c_ha_"])]))
+    module.Write(merged_output_path)
+
+def mergeGates_HS(syn_output_path, merged_output_path="syn_output_path3.v"):
+    # File to file half subtractor fusion
+    with open(syn_output_path, "r") as bmfId:
+        module = NetlistModule(bmfId, syn_output_path)
+    fuseGates(module, OrderedDict([("c_hs_", FUSION_CELLS["c_hs_"])]))
+    module.Write(merged_output_path)
+
+#============== End of Gate fusion ============
+
+
+#================ Functional simulation =================
+
+def Compile_Cell(cell):
+    #A function of the cell inputs that returns its outputs tuple, where every value is a bit vector (a python int).
+    #'!' is the bitwise ~, so the results must be masked to the vectors width.
+    return eval("lambda %s: (%s,)" % (", ".join(cell.inputs), ", ".join(function.replace("!", "~") for function, related in cell.outputs.values())), {"__builtins__": {}})
+
+CELL_FUNCTIONS = dict((name, Compile_Cell(cell)) for name, cell in itertools.chain(LIBRARY_CELLS.items(), FUSION_CELLS.items()))
+
+def Simulate_Microcode(program, input_vectors, num_of_vectors):
+    #Replays a mapped program (a MicrocodeProgram or a MicrocodeReader) over num_of_vectors input vectors at once.
+    #input_vectors maps every input name to its bit vector. Initialization(Ron) sets the cells to 1 (every vector).
+    #An initialization and a gate that touch the same cell in the same cycle have no defined order, and raise a ValueError.
+    #Returns the bit vector of every output, read from its cell at the end of the program.
+    mask = (1 << num_of_vectors) - 1
+    cells = {}
+    for name, cell in program.meta['Input cells'].items():
+        cells[cell] = input_vectors[name]
+    cycle = None
+    for instruction in program:
+        if instruction.time != cycle: #the cells initialized and the cells used by gates in the current cycle
+            cycle = instruction.time
+            init_cells = set()
+            gate_cells = set()
+        if instruction.op == MICROCODE_INIT_OP:
+            conflicts = gate_cells.intersection(instruction.init_cells)
+            if conflicts:
+                raise ValueError("T%d: an initialization resets the cells %s that a gate uses in the same cycle" % (cycle, sorted(conflicts)))
+            init_cells.update(instruction.init_cells)
+            for cell in instruction.init_cells:
+                cells[cell] = mask
+            continue
+        if None in instruction.ins:
+            raise ValueError("T%d: %s reads an input that is not mapped to a cell" % (instruction.time, instruction.op))
+        conflicts = init_cells.intersection(instruction.outs + instruction.ins)
+        if conflicts:
+            raise ValueError("T%d: %s uses the cells %s that an initialization resets in the same cycle" % (cycle, instruction.op, sorted(conflicts)))
+        gate_cells.update(instruction.outs + instruction.ins)
+        outs = CELL_FUNCTIONS[instruction.op](*[cells[cell] for cell in instruction.ins])
+        for cell, value in zip(instruction.outs, outs):
+            cells[cell] = value & mask
+    return OrderedDict((name, cells.get(cell)) for name, cell in program.meta['Output cells'].items())
+
+def Simulate_Netlist(netlist, input_vectors, num_of_vectors):
+    #Evaluates the gate graph of a SIMPLER_Netlist over num_of_vectors input vectors at once, gates in level order.
+    #Returns the bit vector of every net (inputs included).
+    mask = (1 << num_of_vectors) - 1
+    nets = dict(input_vectors)
+    for V_i in netlist.graph.GetLevelizedNodes():
+        gate_number = V_i - netlist.i
+        outs = CELL_FUNCTIONS[netlist.gate_ops[gate_number]](*[nets[net] for net in netlist.gate_ins[gate_number]])
+        for net, value in zip(netlist.gate_outs[gate_number], outs):
+            nets[net] = value & mask
+    return nets
+
+def Verify_Mapping(SIMPLER_TDS, num_of_vectors=4096, seed=0):
+    #Checks that the execution sequence of a mapped SIMPLER_Top_Data_Structure computes its netlist, by simulating
+    #both over num_of_vectors random input vectors. Returns the names of the outputs that differ (empty if it is correct).
+    with contextlib.redirect_stdout(io.StringIO()):
+        program = SIMPLER_TDS.PrintCodeGeneration('MEMORY')
+    rnd = random.Random(seed)
+    input_vectors = OrderedDict((name, rnd.getrandbits(num_of_vectors)) for name in SIMPLER_TDS.InputString)
+    expected = Simulate_Netlist(SIMPLER_TDS.netlist, input_vectors, num_of_vectors)
+    try:
+        mapped = Simulate_Microcode(program, input_vectors, num_of_vectors)
+    except ValueError as e:
+        print('** functional check:', e)
+        return list(program.meta['Output cells'])
+    return [name for name, value in mapped.items() if name in expected and expected[name] != value]
+
+#============== End of Functional simulation ============
+
+
+#================ Crossbar emulation =================
+
+# Emulated throughput of a mapping: rows is the number of crossbar rows the program ran on, instructions the number
+# of its gate instructions (initializations excluded), and seconds the best run time
+EmulationResult = namedtuple('EmulationResult', ['rows', 'instructions', 'seconds', 'rows_per_sec', 'ops_per_sec'])
+
+class CrossbarEmulator:
+    #Runs a mapped row program on every row of a crossbar at once, with numpy: every instruction is a single vectorized
+    #operation over the columns (cells) it reads and writes. The crossbar state is column major, a (columns, W) array:
+    #either bool (W is the number of rows) or bit packed uint64 (64 rows per word, see Pack).
+
+    def __init__(self, SIMPLER_TDS):
+        if np is None:
+            raise ImportError("the crossbar emulator needs numpy")
+        with contextlib.redirect_stdout(io.StringIO()):
+            program = SIMPLER_TDS.PrintCodeGeneration('MEMORY')
+        self.RowSize = SIMPLER_TDS.RowSize
+        self.columns = self.RowSize
+        self.input_cells = list(program.meta['Input cells'].values())
+        self.output_cells = program.meta['Output cells']
+        #The program as (function, output cells, input cells) steps, function None for an initialization
+        self.steps = []
+        self.instructions = 0
+        for instruction in program:
+            if instruction.op == MICROCODE_INIT_OP:
+                #The first initialization also lists the cells beyond the row (up to Get_lr()), which no gate uses
+                init_cells = [cell for cell in instruction.init_cells if cell < self.RowSize]
+                if init_cells:
+                    self.steps.append((None, np.array(init_cells, dtype=np.intp), ()))
+                continue
+            if None in instruction.ins:
+                raise ValueError("T%d: %s reads an input that is not mapped to a cell" % (instruction.time, instruction.op))
+            if max(instruction.outs + instruction.ins) >= self.RowSize:
+                raise ValueError("T%d: %s uses a cell beyond the row of %d cells" % (instruction.time, instruction.op, self.RowSize))
+            self.steps.append((CELL_FUNCTIONS[instruction.op], instruction.outs, instruction.ins))
+            self.instructions += 1
+
+    @staticmethod
+    def Pack(matrix):
+        #A rows X columns bool matrix -> the bit packed column major state (row r is bit r%64 of word r//64)
+        columns = np.packbits(np.asarray(matrix, dtype=bool).T, axis=1, bitorder='little')
+        columns = np.pad(columns, ((0, 0), (0, -columns.shape[1] % 8)))
+        return np.ascontiguousarray(columns).view('<u8').astype(np.uint64)
+
+    @staticmethod
+    def Unpack(state, rows):
+        #The bit packed column major state -> a rows X columns bool matrix
+        columns = np.ascontiguousarray(state.astype('<u8')).view(np.uint8)
+        return np.unpackbits(columns, axis=1, count=rows, bitorder='little').T.astype(bool)
+
+    def Run(self, state):
+        #Executes the program in place over the column major state. An initialization sets its cells to 1 in every row.
+        ones = ~np.zeros(state.shape[1], dtype=state.dtype)
+        for function, outs, ins in self.steps:
+            if function is None:
+                state[outs] = ones
+                continue
+            values = function(*[state[cell] for cell in ins])
+            for cell, value in zip(outs, values):
+                state[cell] = value
+        return state
+
+    def Measure(self, rows, packed=True, repeat=3, seed=0):
+        #Runs the program over a crossbar of rows random rows, repeat times, and returns the EmulationResult of the best run
+        rng = np.random.default_rng(seed)
+        width = (rows + 63) // 64 if packed else rows
+        state = np.zeros((self.columns, width), dtype=np.uint64 if packed else bool)
+        if packed:
+            inputs = rng.integers(0, 1 << 64, size=(len(self.input_cells), width), dtype=np.uint64)
+        else:
+            inputs = rng.integers(0, 2, size=(len(self.input_cells), width)).astype(bool)
+        seconds = float('inf')
+        for i in range(repeat):
+            state[self.input_cells] = inputs
+            t1 = time.perf_counter()
+            self.Run(state)
+            seconds = min(seconds, time.perf_counter() - t1)
+        seconds = max(seconds, 1e-9)
+        return EmulationResult(rows, self.instructions, seconds, rows / seconds, rows * self.instructions / seconds)
+
+def Emulate_Mapping(SIMPLER_TDS, rows, packed=True):
+    #Prints the emulated crossbar throughput of a mapped SIMPLER_Top_Data_Structure. Returns its EmulationResult (None without numpy).
+    if np is None:
+        print('** crossbar emulation needs numpy, skip')
+        return None
+    result = CrossbarEmulator(SIMPLER_TDS).Measure(rows, packed)
+    print('Crossbar emulation (%d rows): %.6f sec, %.0f rows/sec, %.0f ops/sec' % (result.rows, result.seconds, result.rows_per_sec, result.ops_per_sec))
+    return result
+
+#============== End of Crossbar emulation ============
 
     
 #======================== SIMPLER MAPPING =======================
-def SIMPLER_Main (BenchmarkStrings, Max_num_gates, ROW_SIZE, Benchmark_name, generate_json, print_mapping, print_warnings):
-    global JSON_CODE_GEN, PRINT_CODE_GEN, PRINT_WARNING, SORT_ROOTS
+
+# The outcome of mapping one benchmark into one row size. success is None when the net is too big and was skipped.
+# partitions is the number of rows of a multi-row mapping (Map_Partitioned, t is then its end-to-end cycles), else None
+MappingResult = namedtuple('MappingResult', ['benchmark', 'row_size', 'success', 't', 'ReuseCycles', 'writes', 'partitions'], defaults=(None,))
+
+def Set_Run_Parameters(generate_json, print_mapping, print_warnings, sort_roots='NO', allocation_engine='STACK', sequence_format='JSON', verify_mapping=0, emulate_rows=0, root_search=None, partition=False, transfer_cost=2):
+    global JSON_CODE_GEN, PRINT_CODE_GEN, PRINT_WARNING, SORT_ROOTS, ALLOCATION_ENGINE, SEQUENCE_FORMAT, VERIFY_MAPPING, EMULATE_ROWS, ROOT_SEARCH, PARTITION, TRANSFER_COST
+    
+    #The LIST engine schedules the nodes by their level and ignores the roots order, so a roots order search would only repeat one mapping
+    if sort_roots == 'SEARCH' and allocation_engine == 'LIST':
+        raise ValueError("sort_roots 'SEARCH' needs the 'STACK' or 'RECURSIVE' allocation engine, 'LIST' ignores the roots order")
     
     #print controls
     JSON_CODE_GEN = generate_json
     PRINT_CODE_GEN = print_mapping
     PRINT_WARNING = print_warnings
-    SORT_ROOTS = 'NO' #Set to one of the follows: 'NO, 'ASCEND' 'DESCEND' 
+    SORT_ROOTS = sort_roots #Set to one of the follows: 'NO, 'ASCEND' 'DESCEND' 'SEARCH'
+    ALLOCATION_ENGINE = allocation_engine #Set to one of the follows: 'STACK', 'RECURSIVE', 'LIST'
+    SEQUENCE_FORMAT = sequence_format #Set to one of the follows: 'JSON', 'JSONL', 'TEXT', 'BINARY'
+    VERIFY_MAPPING = verify_mapping #Number of random input vectors to simulate every mapping with, 0 for no check
+    EMULATE_ROWS = emulate_rows #Number of crossbar rows to emulate every mapping on (needs numpy), 0 for no emulation
+    ROOT_SEARCH = root_search if root_search is not None else RootSearch(10, 32, 0, 'CYCLES', 1) #Used by SORT_ROOTS = 'SEARCH'
+    PARTITION = partition #Map a netlist that does not fit into a single row into several rows (Map_Partitioned)
+    TRANSFER_COST = transfer_cost #Cycles per value moved from one row to another in a multi-row mapping
+
+def Map_Netlist(netlist, Row_size, Benchmark, Benchmark_name, Max_num_gates, allow_partition=True):
+    #Maps a parsed netlist into a row of Row_size cells and prints the mapping. Returns a MappingResult.
+    #With PARTITION (and allow_partition) a netlist that does not fit into the row is mapped into several rows.
+    SIMPLER_TDS = SIMPLER_Top_Data_Structure(Row_size,netlist,Benchmark_name)
+                  
+    if (SIMPLER_TDS.Get_lr()>Max_num_gates or SIMPLER_TDS.Get_lc()>Max_num_gates):
+        if PARTITION and allow_partition:
+            print("** net too big for a single row " + str(SIMPLER_TDS.Get_lr()) +" X " + str(SIMPLER_TDS.Get_lc()) + ", partition\n")
+            return Map_Partitioned(netlist, Row_size, Benchmark, Benchmark_name, Max_num_gates)
+        print("** net too big, skip " + str(SIMPLER_TDS.Get_lr()) +" X " + str(SIMPLER_TDS.Get_lc()) + "\n")
+        return MappingResult(Benchmark, Row_size, None, None, None, None)
+                      
+    roots_order = None
+    search = None
+    if SORT_ROOTS == 'SEARCH':
+        search = Search_Root_Order(netlist, Row_size, Benchmark_name, ROOT_SEARCH)
+        roots_order = search.roots
+        print('Roots order search: %s is the best of %d orders (%.2f sec)' % (search.name, search.tried, search.seconds))
+                      
+    if search is not None and search.mapping is not None: #The search already mapped the best order
+        SIMPLER_TDS = search.mapping
+        print(search.mapping_log, end='')
+        code_generation_success_flag = True
+    else: #With a search on a pool, the best order is mapped a second time here
+        code_generation_success_flag =SIMPLER_TDS.RunAlgorithm(roots_order)
+    #Statistics calculations 
+    SIMPLER_TDS.Set_Max_Num_Of_Used_Cells(SIMPLER_TDS.cells.max_num_of_used)
+    if (code_generation_success_flag == True):
+        SIMPLER_TDS.PrintCodeGeneration() 
+        if VERIFY_MAPPING:
+            mismatches = Verify_Mapping(SIMPLER_TDS, VERIFY_MAPPING)
+            print('Functional check (%d vectors):' % VERIFY_MAPPING, 'passed' if not mismatches else 'FAILED, outputs ' + ','.join(mismatches))
+        if EMULATE_ROWS:
+            Emulate_Mapping(SIMPLER_TDS, EMULATE_ROWS)
     
-    for Row_size in ROW_SIZE: 
-        for Benchmark in BenchmarkStrings:
-            
-            #Parse operations 
-            bmfId = open(Benchmark,"r") #open file       
-            SIMPLER_TDS = SIMPLER_Top_Data_Structure(Row_size,bmfId,Benchmark_name)
-                          
-            if (SIMPLER_TDS.Get_lr()>Max_num_gates or SIMPLER_TDS.Get_lc()>Max_num_gates):
-                print("** net too big, skip " + str(SIMPLER_TDS.Get_lr()) +" X " + str(SIMPLER_TDS.Get_lc()) + "\n")
+    #Benchmark's end 
+    CellInfo.Set_cur_num_of_used_cells_to_zero() #need to initiate because its a class variable
+    CellInfo.Set_max_num_of_used_cells_to_zero() #need to initiate because its a class variable
+    print('\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\ \n')
+    if code_generation_success_flag == False and PARTITION and allow_partition:
+        return Map_Partitioned(netlist, Row_size, Benchmark, Benchmark_name, Max_num_gates)
+    return MappingResult(Benchmark, Row_size, code_generation_success_flag, SIMPLER_TDS.t, SIMPLER_TDS.ReuseCycles, SIMPLER_TDS.writes)
+
+def Is_Mappable(netlist, Row_size, Benchmark_name, roots_order=None, printed=None):
+    #Probes whether the parsed netlist maps into a row of Row_size cells (with roots_order, see RunAlgorithm), without
+    #printing anything (what the mapping prints goes to the printed stream, if given).
+    #Returns the mapped SIMPLER_TDS, or None if the netlist does not map.
+    if Row_size <= netlist.i: #The inputs alone take Row_size cells
+        return None
+    SIMPLER_TDS = SIMPLER_Top_Data_Structure(Row_size,netlist,Benchmark_name)
+    with contextlib.redirect_stdout(printed if printed is not None else io.StringIO()):
+        return SIMPLER_TDS if SIMPLER_TDS.RunAlgorithm(roots_order) else None
+
+#Process pool workers (of the row size sweep and of the root order search). The data that all the jobs share, the parsed
+#netlists or the netlist to search, is handed to every worker once, by the pool initializer.
+worker_data = None
+
+def Worker_Init(data, run_parameters):
+    global worker_data
+    worker_data = data
+    Set_Run_Parameters(*run_parameters)
+
+def Sweep_Worker_Map(job):
+    #Runs a single mapping of the netlists in worker_data, returns its MappingResult and everything it printed
+    Row_size, Benchmark, Benchmark_name, Max_num_gates = job
+    printed = io.StringIO()
+    with contextlib.redirect_stdout(printed):
+        result = Map_Netlist(worker_data[Benchmark], Row_size, Benchmark, Benchmark_name, Max_num_gates)
+    return result, printed.getvalue()
+
+# The root order search settings, see ROOT_SEARCH
+RootSearch = namedtuple('RootSearch', ['time_budget', 'num_of_random', 'seed', 'cost', 'num_of_workers'])
+# The best roots order that Search_Root_Order found, its mapping (success, t, ReuseCycles), and the number of orders it tried.
+# mapping is the mapped SIMPLER_TDS of the best order and mapping_log what its RunAlgorithm printed, or both None when
+# a pool worker mapped it (or no order maps)
+RootSearchResult = namedtuple('RootSearchResult', ['name', 'roots', 'success', 't', 'ReuseCycles', 'tried', 'seconds', 'mapping', 'mapping_log'])
+
+def Root_Orderings(netlist, Row_size, Benchmark_name, num_of_random, seed):
+    #Returns the candidate roots orders of the root order search, as (name, roots) pairs without repetitions: the
+    #SORT_ROOTS orders, orders weighted by the fanout the roots share with other sub-trees (the fanout of their
+    #childrens beyond themselves), and num_of_random permutations of a random.Random(seed).
+    SIMPLER_TDS = SIMPLER_Top_Data_Structure(Row_size,netlist,Benchmark_name)
+    with contextlib.redirect_stdout(io.StringIO()):
+        roots = SIMPLER_TDS.GetRoots_list()
+    SIMPLER_TDS.computeCU()
+    cu = dict((r, SIMPLER_TDS.NodesList[r].GetNodeCu()) for r in roots)
+    shared = dict((r, sum(SIMPLER_TDS.NodesList[child].GetNodeFO() - 1 for child in SIMPLER_TDS.ChildrenWithoutInputs_list(r))) for r in roots)
+    orderings = [('NO', roots),
+                 ('ASCEND', sorted(roots, key=lambda r: cu[r])),
+                 ('DESCEND', sorted(roots, key=lambda r: cu[r], reverse=True)),
+                 ('FANOUT_DESCEND', sorted(roots, key=lambda r: (shared[r], cu[r]), reverse=True)),
+                 ('FANOUT_ASCEND', sorted(roots, key=lambda r: (shared[r], -cu[r]))),
+                 ('CU_PER_FANOUT', sorted(roots, key=lambda r: cu[r] / (1.0 + shared[r]), reverse=True))]
+    rnd = random.Random(seed)
+    for k in range(num_of_random):
+        order = list(roots)
+        rnd.shuffle(order)
+        orderings.append(('RANDOM_%d' % k, order))
+    seen = set()
+    unique_orderings = []
+    for name, order in orderings:
+        if tuple(order) not in seen:
+            seen.add(tuple(order))
+            unique_orderings.append((name, order))
+    return unique_orderings
+
+def Evaluate_Root_Order(netlist, Row_size, Benchmark_name, roots):
+    #Maps the netlist with the given roots order without printing anything.
+    #Returns (success, t, ReuseCycles), and the mapped SIMPLER_TDS with what its mapping printed (None if it does not map)
+    printed = io.StringIO()
+    SIMPLER_TDS = Is_Mappable(netlist, Row_size, Benchmark_name, roots, printed)
+    if SIMPLER_TDS is None:
+        return (False, None, None), None
+    return (True, SIMPLER_TDS.t, SIMPLER_TDS.ReuseCycles), (SIMPLER_TDS, printed.getvalue())
+
+def Root_Search_Worker_Map(roots):
+    #Evaluates a roots order of the root order search job (netlist, Row_size, Benchmark_name) in worker_data.
+    #The mapping itself stays in the worker, only its (success, t, ReuseCycles) is sent back
+    return Evaluate_Root_Order(*(worker_data + (roots,)))[0]
+
+def Search_Root_Order(netlist, Row_size, Benchmark_name, root_search):
+    #Maps the netlist with the candidate roots orders of Root_Orderings, in their order, on root_search.num_of_workers
+    #processes, until all are done or root_search.time_budget is over. Returns the RootSearchResult of the cheapest
+    #successful mapping (the earliest order among equals), so a given seed always gives the same result as long as
+    #the budget lets the same number of orders through.
+    t1 = time.time()
+    orderings = Root_Orderings(netlist, Row_size, Benchmark_name, root_search.num_of_random, root_search.seed)
+    job = (netlist, Row_size, Benchmark_name)
+    
+    def cost(evaluation):
+        success, t, ReuseCycles = evaluation
+        if not success:
+            return (1, 0, 0)
+        return (0, ReuseCycles, t) if root_search.cost == 'REUSE' else (0, t, ReuseCycles)
+    
+    pool = None
+    if root_search.num_of_workers <= 1 or multiprocessing.current_process().daemon: #A pool worker cannot start a pool of its own
+        evaluations = (Evaluate_Root_Order(*(job + (roots,))) for name, roots in orderings)
+    else:
+        run_parameters = (False, False, PRINT_WARNING, 'NO', ALLOCATION_ENGINE)
+        pool = multiprocessing.Pool(min(root_search.num_of_workers, len(orderings)), Worker_Init, (job, run_parameters))
+        evaluations = ((evaluation, None) for evaluation in pool.imap(Root_Search_Worker_Map, [roots for name, roots in orderings])) #imap keeps the orders sequence
+    best = None
+    tried = 0
+    try:
+        for (name, roots), (evaluation, mapping) in zip(orderings, evaluations):
+            tried += 1
+            if best is None or cost(evaluation) < cost(best[2]):
+                best = (name, roots, evaluation, mapping) #Only the best mapping is kept
+            if root_search.time_budget and time.time() - t1 > root_search.time_budget:
+                break
+    finally:
+        if pool is not None:
+            pool.terminate()
+    name, roots, (success, t, ReuseCycles), mapping = best
+    mapping, mapping_log = mapping if mapping is not None else (None, None)
+    return RootSearchResult(name, roots, success, t, ReuseCycles, tried, time.time() - t1, mapping, mapping_log)
+
+# A partition of a multi-row mapping: its gates (gate numbers of the whole netlist), and its own SIMPLER_Netlist
+# whose inputs are primary inputs or values of earlier partitions, and whose outputs are kept to the end of its row program
+Partition = namedtuple('Partition', ['gates', 'netlist'])
+
+def Partition_Order(netlist, Row_size, Benchmark_name):
+    #The gate numbers in the depth-first SIMPLER order (the AllocateRow visit: roots order, childrens by CU).
+    #Every gate comes after its childrens, and a sub-tree is kept together as much as possible.
+    SIMPLER_TDS = SIMPLER_Top_Data_Structure(Row_size,netlist,Benchmark_name)
+    with contextlib.redirect_stdout(io.StringIO()):
+        roots = SIMPLER_TDS.GetRoots_list()
+    SIMPLER_TDS.computeCU()
+    SIMPLER_TDS.SortChildrenByCU()
+    visited = set()
+    order = []
+    for r in roots:
+        stack = [[r, 0]]
+        visited.add(r)
+        while stack:
+            V_j, pos = stack[-1]
+            childrens = SIMPLER_TDS.ChildrenSortedByCU_list(V_j)
+            while pos < len(childrens) and childrens[pos] in visited:
+                pos += 1
+            if pos < len(childrens):
+                stack[-1][1] = pos + 1
+                visited.add(childrens[pos])
+                stack.append([childrens[pos], 0])
                 continue
-                              
-            #Statistics calculations 
-            SIMPLER_TDS.Set_Max_Num_Of_Used_Cells(CellInfo.get_max_num_of_used_cells())
-            code_generation_success_flag =SIMPLER_TDS.RunAlgorithm()
-            if (code_generation_success_flag == True):
-                SIMPLER_TDS.PrintCodeGeneration() 
-            
-            #Benchmark's end 
-            bmfId.close() #close file
-            CellInfo.Set_cur_num_of_used_cells_to_zero() #need to initiate because its a class variable
-            CellInfo.Set_max_num_of_used_cells_to_zero() #need to initiate because its a class variable
-            print('\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\ \n')
+            stack.pop()
+            order.append(V_j - netlist.i)
+    return order
+
+def Make_Partition(netlist, gates, consumers, name):
+    #Returns the Partition of the given gates. consumers maps every net to the gate numbers that read it.
+    gate_set = set(gates)
+    produced = [net for gate_number in gates for net in netlist.gate_outs[gate_number]]
+    produced_set = set(produced)
+    inputs = list(OrderedDict.fromkeys(net for gate_number in gates for net in netlist.gate_ins[gate_number] if net not in produced_set))
+    primary_outputs = set(netlist.OutputString)
+    outputs = [net for net in produced if net in primary_outputs or any(gate_number not in gate_set for gate_number in consumers.get(net, ()))]
+    output_set = set(outputs)
+    wires = [net for net in produced if net not in output_set]
+    module = NetlistModule.FromGates(name, inputs, outputs, wires, [netlist.gates[gate_number] for gate_number in gates])
+    return Partition(gates, SIMPLER_Netlist(module, partition=True))
+
+def Partition_Netlist(netlist, Row_size, Benchmark_name, Max_num_gates):
+    #Splits the gates into partitions that each map into a single row of Row_size cells (and Max_num_gates), as
+    #consecutive runs of the Partition_Order. Every partition is grown to the largest run that still maps (doubling,
+    #then bisection). It may then be cut back to the boundary that the fewest nets cross, but only boundaries within
+    #its last quarter are considered, so the number of nets between the partitions is not minimized.
+    #Returns the list of Partitions, or None when a single gate does not map.
+    order = Partition_Order(netlist, Row_size, Benchmark_name)
+    position = dict((gate_number, pos) for pos, gate_number in enumerate(order))
+    consumers = {}
+    for gate_number in order:
+        for net in netlist.gate_ins[gate_number]:
+            consumers.setdefault(net, []).append(gate_number)
+    #cut[e] - the number of nets produced before position e and read at e or after it
+    cut = [0] * (len(order) + 2)
+    for pos, gate_number in enumerate(order):
+        for net in netlist.gate_outs[gate_number]:
+            last = max([position[consumer] for consumer in consumers.get(net, ()) if consumer in position], default=pos)
+            if last > pos:
+                cut[pos + 1] += 1
+                cut[last + 1] -= 1
+    for e in range(1, len(cut)):
+        cut[e] += cut[e - 1]
+    
+    def fits(start, end):
+        partition = Make_Partition(netlist, order[start:end], consumers, Benchmark_name)
+        if partition.netlist.lr > Max_num_gates or partition.netlist.lc > Max_num_gates:
+            return None
+        return partition if Is_Mappable(partition.netlist, Row_size, Benchmark_name) else None
+    
+    partitions = []
+    start = 0
+    while start < len(order):
+        best = fits(start, start + 1)
+        if best is None:
+            return None
+        good, size = start + 1, 2
+        bad = None
+        while good < len(order): #doubling
+            end = min(start + size, len(order))
+            partition = fits(start, end)
+            if partition is None:
+                bad = end
+                break
+            good, best = end, partition
+            size *= 2
+        while bad is not None and bad - good > 1: #bisection, good maps and bad does not
+            mid = (good + bad) // 2
+            partition = fits(start, mid)
+            if partition is None:
+                bad = mid
+            else:
+                good, best = mid, partition
+        if good < len(order):
+            end = min(range(good - (good - start) // 4, good + 1), key=lambda e: (cut[e], -e))
+            partition = fits(start, end) if end != good else None
+            if partition is not None:
+                good, best = end, partition
+        partitions.append(best)
+        start = good
+    return partitions
+
+def Map_Partitioned(netlist, Row_size, Benchmark, Benchmark_name, Max_num_gates):
+    #Maps a netlist that does not fit into a single row into several rows of Row_size cells (Partition_Netlist), and
+    #prints every partition mapping and the combined schedule. The rows run in parallel: a partition starts when the
+    #partitions it reads from are done and their values are moved into its row, TRANSFER_COST cycles per value.
+    #With JSON_CODE_GEN the schedule is written to PART_<row size>_<benchmark>.json. Returns a MappingResult.
+    print('\\\\\\\\\\\\ MULTI-ROW MAPPING OF',Benchmark_name,'WITH ROW SIZE =',Row_size,' \\\\\\\\\\\\\n')
+    partitions = Partition_Netlist(netlist, Row_size, Benchmark_name, Max_num_gates)
+    if partitions is None:
+        print('False - no multi-row mapping (a single gate does not fit into the row)\n')
+        return MappingResult(Benchmark, Row_size, False, None, None, None, 0)
+    producer = {}
+    for k, partition in enumerate(partitions):
+        for net in partition.netlist.OutputString:
+            producer[net] = k
+    schedule = []
+    finish = []
+    transfers = []
+    ReuseCycles = writes = 0
+    for k, partition in enumerate(partitions):
+        name = '%s_part%d' % (Benchmark_name, k)
+        result = Map_Netlist(partition.netlist, Row_size, name, name, Max_num_gates, allow_partition=False)
+        if not result.success:
+            return MappingResult(Benchmark, Row_size, False, None, None, None, len(partitions))
+        moved = [(net, producer[net]) for net in partition.netlist.InputString if net in producer]
+        transfers += [(net, source, k) for net, source in moved]
+        start = max([finish[source] for net, source in moved], default=0) + TRANSFER_COST * len(moved)
+        finish.append(start + result.t)
+        ReuseCycles += result.ReuseCycles
+        writes += result.writes + len(moved)
+        schedule.append(OrderedDict([('Partition', name), ('Number of Gates', len(partition.gates)), ('Start', start), ('Finish', finish[-1]),
+                                     ('Inputs', partition.netlist.InputString), ('Outputs', partition.netlist.OutputString)]))
+    end_to_end = max(finish)
+    cut_nets = len(set(net for net, source, k in transfers))
+    print('Multi-row mapping of %s: %d rows, %d cut nets, %d transfers (%d cycles)' % (Benchmark_name, len(partitions), cut_nets, len(transfers), TRANSFER_COST * len(transfers)))
+    print('End-to-end cycles:', end_to_end)
+    print('\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\\ \n')
+    if JSON_CODE_GEN == True:
+        directory, name = os.path.split(Benchmark_name)
+        top_JSON_dict = OrderedDict([('Benchmark', Benchmark_name), ('Row size', Row_size), ('Number of rows', len(partitions)),
+                                     ('Transfer cost', TRANSFER_COST), ('End-to-end cycles', end_to_end), ('Partitions', schedule),
+                                     ('Transfers', [OrderedDict([('Net', net), ('From', source), ('To', k)]) for net, source, k in transfers])])
+        with open(os.path.join(directory, 'PART_' + str(Row_size) + '_' + name + '.json'), 'w') as f:
+            simplejson.dump(top_JSON_dict, f, indent=4)
+    return MappingResult(Benchmark, Row_size, True, end_to_end, ReuseCycles, writes, len(partitions))
+
+def Parse_Benchmark(Benchmark):
+    #A benchmark is either a netlist file path or a NetlistModule that is already in memory. Returns its name and SIMPLER_Netlist
+    if isinstance(Benchmark, NetlistModule):
+        return Benchmark.name, SIMPLER_Netlist(Benchmark)
+    with open(Benchmark,"r") as bmfId:
+        return Benchmark, SIMPLER_Netlist(bmfId)
+
+def SIMPLER_Main (BenchmarkStrings, Max_num_gates, ROW_SIZE, Benchmark_name, generate_json, print_mapping, print_warnings, num_of_workers=1, sequence_format='JSON', verify_mapping=0, emulate_rows=0, sort_roots='NO', root_search=None, allocation_engine='STACK', partition=False, transfer_cost=2):
+    #Maps every benchmark into every row size. With num_of_workers > 1 the mappings run on a process pool,
+    #and their prints and results are still reported in the ROW_SIZE order. Returns a list of MappingResult.
+    #BenchmarkStrings holds netlist file paths and/or NetlistModules (see Parse_Benchmark).
+    
+    run_parameters = (generate_json, print_mapping, print_warnings, sort_roots, allocation_engine, sequence_format, verify_mapping, emulate_rows, root_search, partition, transfer_cost)
+    Set_Run_Parameters(*run_parameters)
+    
+    #Parse operations, once per benchmark for all the row sizes
+    netlists = OrderedDict(Parse_Benchmark(Benchmark) for Benchmark in BenchmarkStrings)
+    
+    jobs = [(Row_size, Benchmark, Benchmark_name, Max_num_gates) for Row_size in ROW_SIZE for Benchmark in netlists]
+    results = []
+    if num_of_workers <= 1 or len(jobs) <= 1:
+        for Row_size, Benchmark, Benchmark_name, Max_num_gates in jobs:
+            results.append(Map_Netlist(netlists[Benchmark], Row_size, Benchmark, Benchmark_name, Max_num_gates))
+    else:
+        with multiprocessing.Pool(min(num_of_workers, len(jobs)), Worker_Init, (netlists, run_parameters)) as pool:
+            for result, printed in pool.imap(Sweep_Worker_Map, jobs): #imap keeps the jobs order
+                print(printed, end='')
+                results.append(result)
+    return results
+
+def SIMPLER_Min_Row_Size (BenchmarkStrings, Max_num_gates, Row_size_bounds, Benchmark_name, generate_json, print_mapping, print_warnings, sequence_format='JSON', verify_mapping=0, emulate_rows=0, sort_roots='NO', root_search=None, allocation_engine='STACK', partition=False, transfer_cost=2):
+    #Finds the minimal row size every benchmark maps into, by a bisection over RunAlgorithm feasibility between
+    #Row_size_bounds = [lower, upper]. The netlist is parsed once for all the probes, and only the mapping of the
+    #minimal row size is printed. Returns a list of MappingResult (success is False if upper does not map either).
+    #With PARTITION a benchmark that does not map into upper (or is too big) is mapped into several rows of upper cells.
+    
+    #With SORT_ROOTS = 'SEARCH' the probes use the arbitrary ('NO') roots order, and only the minimal row size is searched
+    Set_Run_Parameters(generate_json, print_mapping, print_warnings, sort_roots, allocation_engine, sequence_format=sequence_format, verify_mapping=verify_mapping, emulate_rows=emulate_rows, root_search=root_search, partition=partition, transfer_cost=transfer_cost)
+    lower, upper = Row_size_bounds
+    if lower > upper:
+        raise ValueError("the row size bounds [%d, %d] are inverted (lower > upper)" % (lower, upper))
+    
+    results = []
+    for Benchmark in BenchmarkStrings:
+        Benchmark, netlist = Parse_Benchmark(Benchmark)
+        too_big = netlist.lr>Max_num_gates or netlist.lc>Max_num_gates
+        upper_maps = not too_big and Is_Mappable(netlist, upper, Benchmark_name) #The first probe
+        if PARTITION and not upper_maps:
+            results.append(Map_Netlist(netlist, upper, Benchmark, Benchmark_name, Max_num_gates))
+            continue
+        if too_big:
+            print("** net too big, skip " + str(netlist.lr) +" X " + str(netlist.lc) + "\n")
+            results.append(MappingResult(Benchmark, None, None, None, None, None))
+            continue
+        
+        num_of_probes = 1
+        if not upper_maps:
+            print('\\\\\\\\\\\\ MAPPING OF',Benchmark_name,'WITH ROW SIZE UP TO',upper,' \\\\\\\\\\\\\n')
+            print('False - no mapping\n')
+            results.append(MappingResult(Benchmark, upper, False, None, None, None))
+            continue
+        lo = max(lower, netlist.i + 1)
+        hi = upper #Invariant: hi maps, every row size below lo does not
+        while lo < hi:
+            mid = (lo + hi) // 2
+            num_of_probes += 1
+            if Is_Mappable(netlist, mid, Benchmark_name):
+                hi = mid
+            else:
+                lo = mid + 1
+        print('Minimal row size:', hi, '(%d probes)' % num_of_probes)
+        results.append(Map_Netlist(netlist, hi, Benchmark, Benchmark_name, Max_num_gates))
+    return results
 
 #=========================== End of SIMPLER MAPPING ===========================
 
@@ -6,53 +6,206 @@ import ast
 import json
 import synopsys_dc
 import time
-from shutil import copyfile
+from shutil import rmtree
 import ntpath
+import io
+import contextlib
+import multiprocessing
+import asyncio
+import concurrent.futures
+from collections import OrderedDict
+
+def run_benchmark(path, workspace, Max_num_gates, ROW_SIZE, ROW_SIZE_SEARCH, generate_json, print_mapping, print_warnings, num_of_workers, fusion_cells=None, write_unfused_netlists=False, sequence_format='JSON', verify_mapping=0, emulate_rows=0, sort_roots='NO', root_search=None, allocation_engine='STACK', partition=False, transfer_cost=2, synthesized_path=None):
+    # Synthesizes, merges and maps a single benchmark. Returns its list of SIMPLER_Mapping.MappingResult.
+    # synthesized_path is the netlist of a batch synthesis (synopsys_dc.synt_batch), in which case synthesis is skipped.
+    # fusion_cells is the SIMPLER_Mapping.FUSION_CELLS subset to fuse (None or empty - no fusion).
+    # The synthesized netlist is parsed once, and the fusion passes and the mapping work on it in memory.
+    # The synthesis files are written into workspace, or to the fixed names in the current directory when workspace is None.
+    if workspace is None:
+        syn_output_path = "syn_output_path.v"
+        synt_script_path = "dc_scripts/synt_temp.dc"
+    else:
+        syn_output_path = os.path.join(workspace, "syn_output_path.v")
+        synt_script_path = os.path.join(workspace, "synt_temp.dc")
+    syn_res_path = "syn_res_dir/%s_%d" % (ntpath.basename(path), synopsys_dc.SyntSet.set0.value-1)
+
+    t1 = time.time()
+    if synthesized_path is None:
+        synopsys_dc.synt(path, syn_output_path, synt_script_path, workspace)
+    else:
+        syn_output_path = synthesized_path
+    with open(syn_output_path, "r") as bmfId:
+        module = SIMPLER_Mapping.NetlistModule(bmfId, syn_output_path)
+
+    # Find multi-output cells and merge them
+    SIMPLER_Mapping.tieConstants(module)
+    if write_unfused_netlists:
+        module.Write(syn_res_path + "_unfused.v")
+    if fusion_cells:
+        SIMPLER_Mapping.fuseGates(module, fusion_cells)
+    module.Write(syn_res_path + ".v")
+
+    # Mapping into the memory array
+    #SIMPLER_Mapping.SIMPLER_Main([syn_output_path], Max_num_gates, ROW_SIZE, input_path.split(".")[0], generate_json, print_mapping, print_warnings)
+    if ROW_SIZE_SEARCH:
+        results = SIMPLER_Mapping.SIMPLER_Min_Row_Size([module], Max_num_gates, ROW_SIZE_SEARCH, path.split(".")[0], generate_json, print_mapping, print_warnings, sequence_format, verify_mapping, emulate_rows, sort_roots, root_search, allocation_engine, partition, transfer_cost)
+    else:
+        results = SIMPLER_Mapping.SIMPLER_Main([module], Max_num_gates, ROW_SIZE, path.split(".")[0], generate_json, print_mapping, print_warnings, num_of_workers, sequence_format, verify_mapping, emulate_rows, sort_roots, root_search, allocation_engine, partition, transfer_cost)
+
+
+    # Clean files
+    # os.remove(abc_output_path)
+    t2 = time.time()
+    print("Total execution time:", t2 - t1)
+    return results
+
+def run_benchmark_job(job):
+    # Process pool job of the parallel directory mode: runs a benchmark in its own temporary workspace,
+    # and returns its results together with everything it printed
+    path, synthesized_path, args = job
+    workspace = tempfile.mkdtemp(prefix="simpler_%s_" % ntpath.basename(path).split(".")[0])
+    printed = io.StringIO()
+    try:
+        with contextlib.redirect_stdout(printed):
+            results = run_benchmark(path, workspace, *args, synthesized_path=synthesized_path)
+    finally:
+        rmtree(workspace, ignore_errors=True)
+    return path, results, printed.getvalue()
+
+async def run_dir_async(input_paths, args, max_synthesis_jobs, synthesis_timeout, num_of_jobs):
+    # Runs the syntheses as asyncio subprocesses, at most max_synthesis_jobs at once, while the benchmarks that were
+    # already synthesized are merged and mapped on a pool of num_of_jobs processes. Returns the jobs results in input order.
+    semaphore = asyncio.Semaphore(max_synthesis_jobs)
+    loop = asyncio.get_event_loop()
+    synt_dir = tempfile.mkdtemp(prefix="simpler_async_")
+
+    async def benchmark_job(idx, path, executor):
+        # Every synthesis runs dc_shell in its own directory, so the concurrent runs do not share the DC log and work files
+        workspace = os.path.join(synt_dir, str(idx))
+        os.mkdir(workspace)
+        synthesized_path = os.path.join(workspace, ntpath.basename(path))
+        synt_job = await synopsys_dc.synt_async(path, synthesized_path, synthesized_path + ".dc", semaphore, synthesis_timeout, workspace)
+        if synt_job.log:
+            open("syn_res_dir/%s_synt.log" % ntpath.basename(path), "w").write(synt_job.log)
+        if synt_job.timed_out:
+            return path, [], "** synthesis of %s timed out after %s seconds, skip\n" % (path, synthesis_timeout)
+        if synt_job.returncode != 0:
+            return path, [], "** synthesis of %s failed (return code %d), skip\n" % (path, synt_job.returncode)
+        return await loop.run_in_executor(executor, run_benchmark_job, (path, synthesized_path, args))
+
+    try:
+        with concurrent.futures.ProcessPoolExecutor(num_of_jobs) as executor:
+            return await asyncio.gather(*[benchmark_job(idx, path, executor) for idx, path in enumerate(input_paths)])
+    finally:
+        rmtree(synt_dir, ignore_errors=True)
+
+def print_summary(all_results):
+    print("SUMMARY:")
+    for path, results in all_results:
+        for result in results:
+            if result.success is None:
+                status = "skipped (net too big)"
+            elif not result.success:
+                status = "no mapping"
+            elif result.partitions:
+                # The rows overlap in time and their reuse cycles are summed over all the rows, so the end-to-end
+                # cycles keep the reuse (and transfer) cycles and are not comparable with the single row cycles
+                status = "rows=%d, end-to-end cycles incl. reuse and transfers=%d, reuse cycles of all rows=%d, writes=%d" % (result.partitions, result.t, result.ReuseCycles, result.writes)
+            else:
+                status = "cycles excl. reuse=%d, reuse cycles=%d, writes=%d" % (result.t - result.ReuseCycles, result.ReuseCycles, result.writes)
+            print("%s, row size=%s: %s" % (path, result.row_size, status))
 
 def main():
-  
+
     # Read configuration parameters
     config = configparser.ConfigParser()
     config.readfp(open('simpler_conf.cfg'))
     input_path = config.get('input_output', 'input_path')
     input_dir = config.get('input_output', 'input_dir')
     run_dir = config.getboolean('input_output', 'run_dir')
+    num_of_jobs = config.getint('input_output', 'num_of_jobs', fallback=1)
+    batch_synthesis = config.getboolean('input_output', 'batch_synthesis', fallback=False)
+    async_synthesis = config.getboolean('input_output', 'async_synthesis', fallback=False)
+    max_synthesis_jobs = config.getint('input_output', 'max_synthesis_jobs', fallback=1)
+    synthesis_timeout = config.getfloat('input_output', 'synthesis_timeout', fallback=0) or None
     input_format = config.get('input_output', 'input_format')
     #BenchmarkStrings = ast.literal_eval(config.get("SIMPLER_Mapping", "BenchmarkStrings"))
     Max_num_gates = config.getint('SIMPLER_Mapping', 'Max_num_gates')
     ROW_SIZE = [int(i) for i in ast.literal_eval(config.get("SIMPLER_Mapping", "ROW_SIZE"))]
+    ROW_SIZE_SEARCH = [int(i) for i in ast.literal_eval(config.get("SIMPLER_Mapping", "ROW_SIZE_SEARCH", fallback="[]"))]
     output_path = config.get('input_output', 'output_path')
     generate_json = config.getboolean('SIMPLER_Mapping', 'generate_json')
     print_mapping = config.getboolean('SIMPLER_Mapping', 'print_mapping')
     print_warnings = config.getboolean('SIMPLER_Mapping', 'print_warnings')
-    
+    num_of_workers = config.getint('SIMPLER_Mapping', 'num_of_workers', fallback=1)
+    sequence_format = config.get('SIMPLER_Mapping', 'sequence_format', fallback='JSON')
+    verify_mapping = config.getint('SIMPLER_Mapping', 'verify_mapping', fallback=0)
+    emulate_rows = config.getint('SIMPLER_Mapping', 'emulate_rows', fallback=0)
+    allocation_engine = config.get('SIMPLER_Mapping', 'allocation_engine', fallback='STACK')
+    partition = config.getboolean('SIMPLER_Mapping', 'partition', fallback=False)
+    transfer_cost = config.getint('SIMPLER_Mapping', 'transfer_cost', fallback=2)
+    sort_roots = config.get('SIMPLER_Mapping', 'sort_roots', fallback='NO')
+    root_search = SIMPLER_Mapping.RootSearch(config.getfloat('SIMPLER_Mapping', 'root_search_time', fallback=10),
+                                             config.getint('SIMPLER_Mapping', 'root_search_orders', fallback=32),
+                                             config.getint('SIMPLER_Mapping', 'root_search_seed', fallback=0),
+                                             config.get('SIMPLER_Mapping', 'root_search_cost', fallback='CYCLES'),
+                                             config.getint('SIMPLER_Mapping', 'root_search_workers', fallback=1))
+    write_unfused_netlists = config.getboolean('input_output', 'write_unfused_netlists', fallback=False)
+    fusion_cells = OrderedDict((name, SIMPLER_Mapping.FUSION_CELLS[name]) for name in ast.literal_eval(config.get("SIMPLER_Mapping", "fusion_cells", fallback="[]")))
+    # Reject an invalid combination of mapping parameters before the (long) synthesis
+    SIMPLER_Mapping.Set_Run_Parameters(generate_json, print_mapping, print_warnings, sort_roots, allocation_engine, sequence_format, verify_mapping, emulate_rows, root_search, partition, transfer_cost)
+
     if run_dir:
         input_paths = [os.path.join(input_dir, f) for f in os.listdir(input_dir)]
     else:
         input_paths = [input_path]
-    
-    syn_output_path = "syn_output_path.v"
-    
+
     # Compile library
     synopsys_dc.compile_lib(synopsys_dc.SyntSet.set0)
-    
-    for path in input_paths:
-        t1 = time.time()
-        synopsys_dc.synt(path, syn_output_path)
-        
-        # Find multi-output cells and merge them
-        SIMPLER_Mapping.mergeGates_HA(syn_output_path)
-        SIMPLER_Mapping.mergeGates_HS("syn_output_path2.v")
-        copyfile("syn_output_path2.v", "syn_res_dir/%s_%d.v" % (ntpath.basename(path), synopsys_dc.SyntSet.set0.value-1))
-        
-        # Mapping into the memory array
-        #SIMPLER_Mapping.SIMPLER_Main([syn_output_path], Max_num_gates, ROW_SIZE, input_path.split(".")[0], generate_json, print_mapping, print_warnings)
-        SIMPLER_Mapping.SIMPLER_Main(["syn_output_path2.v"], Max_num_gates, ROW_SIZE, path.split(".")[0], generate_json, print_mapping, print_warnings)
-            
-
-        # Clean files
-        # os.remove(abc_output_path)
-        t2 = time.time()
-        print("Total execution time:", t2 - t1)
+
+    if run_dir and async_synthesis:
+        # Synthesis and mapping overlap: every benchmark is mapped as soon as its own synthesis is done
+        args = (Max_num_gates, ROW_SIZE, ROW_SIZE_SEARCH, generate_json, print_mapping, print_warnings, 1, fusion_cells, write_unfused_netlists, sequence_format, verify_mapping, emulate_rows, sort_roots, root_search, allocation_engine, partition, transfer_cost)
+        loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(loop)
+        try:
+            jobs_results = loop.run_until_complete(run_dir_async(input_paths, args, max_synthesis_jobs, synthesis_timeout, num_of_jobs))
+        finally:
+            loop.close()
+        for path, results, printed in jobs_results:
+            print(printed, end='')
+        print_summary([(path, results) for path, results, printed in jobs_results])
+        return
+
+    # Synthesize all the benchmarks in a single DC session
+    synthesized_paths = [None] * len(input_paths)
+    batch_dir = None
+    if run_dir and batch_synthesis:
+        batch_dir = tempfile.mkdtemp(prefix="simpler_batch_")
+        synthesized_paths = [os.path.join(batch_dir, "%d_%s" % (idx, ntpath.basename(path))) for idx, path in enumerate(input_paths)]
+        synopsys_dc.synt_batch(input_paths, synthesized_paths, os.path.join(batch_dir, "synt_batch_temp.dc"), batch_dir)
+    # A benchmark whose block failed in the batch synthesis has no netlist, and is skipped
+    benchmarks = []
+    for path, synthesized_path in zip(input_paths, synthesized_paths):
+        if synthesized_path is not None and not os.path.exists(synthesized_path):
+            print("** synthesis of %s failed, skip" % path)
+        else:
+            benchmarks.append((path, synthesized_path))
+
+    if run_dir and num_of_jobs > 1 and len(benchmarks) > 1:
+        # Several benchmarks at once, each in its own workspace. The pool workers are daemonic and cannot
+        # start a pool of their own, so every benchmark maps its row sizes sequentially.
+        args = (Max_num_gates, ROW_SIZE, ROW_SIZE_SEARCH, generate_json, print_mapping, print_warnings, 1, fusion_cells, write_unfused_netlists, sequence_format, verify_mapping, emulate_rows, sort_roots, root_search, allocation_engine, partition, transfer_cost)
+        all_results = []
+        with multiprocessing.Pool(min(num_of_jobs, len(benchmarks))) as pool:
+            for path, results, printed in pool.imap(run_benchmark_job, [(path, synthesized_path, args) for path, synthesized_path in benchmarks]):
+                print(printed, end='')
+                all_results.append((path, results))
+        print_summary(all_results)
+    else:
+        for path, synthesized_path in benchmarks:
+            run_benchmark(path, None, Max_num_gates, ROW_SIZE, ROW_SIZE_SEARCH, generate_json, print_mapping, print_warnings, num_of_workers, fusion_cells, write_unfused_netlists, sequence_format, verify_mapping, emulate_rows, sort_roots, root_search, allocation_engine, partition, transfer_cost, synthesized_path)
+    if batch_dir is not None:
+        rmtree(batch_dir, ignore_errors=True)
 if __name__ == "__main__":
     main()
@@ -5,6 +5,10 @@ import re
 import ntpath
 from enum import Enum
 import subprocess
+import hashlib
+import shutil
+import asyncio
+from collections import namedtuple
 
 SyntSet = Enum("SyntSet", "set0 set1 set2 set3 set4")
 
@@ -476,6 +480,10 @@ BENCHMARKS = [
 
 RESULT_PATH = "new_results/output_set3_trans.txt"
 
+# Synthesis results cache: synthesized netlists stored by the hash of their inputs (set SYNT_CACHE_DIR to None to disable)
+SYNT_CACHE_DIR = "synt_cache"
+SYNT_CACHE_MAX_BYTES = 1024 * 1024 * 1024
+
 def powerset(iterable):
     """
     powerset([1,2,3]) --> () (1,) (2,) (3,) (1,2) (1,3) (2,3) (1,2,3)
@@ -484,25 +492,185 @@ def powerset(iterable):
     # note we return an iterator rather than a list
     return list(chain.from_iterable(combinations(xs, n) for n in range(1, len(xs) + 1)))
 
+def read_fingerprint(db_path):
+    try:
+        return open(db_path + ".sha256", 'r').read()
+    except FileNotFoundError:
+        return None
+
+def write_fingerprint(db_path, fingerprint):
+    open(db_path + ".sha256", 'w').write(fingerprint)
+
 def compile_lib(syntSet):
     # Create a Liberty library which includes a subset of the opcodes
-    open("libs/gate_subset.lib", 'w').write(LIB_TEMPLATE.replace("CELLS", "\n".join(SETS[syntSet.value - 1])))
+    lib = LIB_TEMPLATE.replace("CELLS", "\n".join(SETS[syntSet.value - 1]))
+    open("libs/gate_subset.lib", 'w').write(lib)
+    
+    # The compiled library depends only on the Liberty text and the compilation script. A compiled copy of every
+    # set is kept next to the active library (libs/op_cond_all_<set>.db), so switching sets does not run DC again.
+    fingerprint = hashlib.sha256((lib + open("dc_scripts/compile_lib.dc", 'r').read()).encode()).hexdigest()
+    db_path = "libs/op_cond_all.db"
+    set_db_path = "libs/op_cond_all_%s.db" % syntSet.name
+    if read_fingerprint(db_path) == fingerprint and os.path.exists(db_path):
+        return
+    if read_fingerprint(set_db_path) == fingerprint and os.path.exists(set_db_path):
+        shutil.copyfile(set_db_path, db_path)
+        write_fingerprint(db_path, fingerprint)
+        return
     
     # Compile library
+    for stale_path in (db_path, db_path + ".sha256"):
+        if os.path.exists(stale_path):
+            os.remove(stale_path)
     subprocess.run("dc_shell -f dc_scripts/compile_lib.dc", shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    if os.path.exists(db_path):
+        write_fingerprint(db_path, fingerprint)
+        shutil.copyfile(db_path, set_db_path)
+        write_fingerprint(set_db_path, fingerprint)
     
-def synt(benchmark_fname, synt_output_path):
+def synt_cache_key(benchmark_fname):
+    # The synthesized netlist depends on the input RTL, the compiled gate subset library and the synthesis script template
+    key = hashlib.sha256()
+    for path in (benchmark_fname, "libs/gate_subset.lib", "dc_scripts/synt.dc"):
+        data = open(path, 'rb').read()
+        key.update(str(len(data)).encode())
+        key.update(data)
+    return key.hexdigest()
+
+def synt_cache_get(key, synt_output_path):
+    # On a hit, copies the cached netlist to synt_output_path and marks it as the most recently used entry
+    cached_path = os.path.join(SYNT_CACHE_DIR, key + ".v")
+    try:
+        shutil.copyfile(cached_path, synt_output_path)
+        os.utime(cached_path)
+    except FileNotFoundError:
+        return False
+    return True
+
+def synt_cache_put(key, synt_output_path):
+    # Stores a synthesized netlist and evicts the least recently used entries above SYNT_CACHE_MAX_BYTES
+    os.makedirs(SYNT_CACHE_DIR, exist_ok=True)
+    cached_path = os.path.join(SYNT_CACHE_DIR, key + ".v")
+    fd, tmp_path = tempfile.mkstemp(dir=SYNT_CACHE_DIR, suffix=".tmp")
+    os.close(fd)
+    shutil.copyfile(synt_output_path, tmp_path)
+    os.replace(tmp_path, cached_path) # atomic, for concurrent synthesis jobs
     
-    # Create synthesis script
+    entries = []
+    for fname in os.listdir(SYNT_CACHE_DIR):
+        if fname.endswith(".v"):
+            try:
+                stat = os.stat(os.path.join(SYNT_CACHE_DIR, fname))
+            except FileNotFoundError:
+                continue
+            entries.append((stat.st_mtime, stat.st_size, fname))
+    entries.sort()
+    total_size = sum(size for _, size, _ in entries)
+    for _, size, fname in entries:
+        if total_size <= SYNT_CACHE_MAX_BYTES:
+            break
+        try:
+            os.remove(os.path.join(SYNT_CACHE_DIR, fname))
+        except FileNotFoundError:
+            pass
+        total_size -= size
+
+def synt_script_header():
+    # dc_shell runs in the job's workspace, so the libraries that the setup names relative to this directory
+    # (libs/op_cond_all.db) are looked up by the absolute paths of this directory and of libs
+    return "set search_path [concat {%s %s} $search_path]\n" % (os.path.abspath("."), os.path.abspath("libs"))
+
+def synt_script_block(benchmark_fname, synt_output_path, with_exit=True):
+    # The synthesis script of a single design, generated from the dc_scripts/synt.dc template.
+    # The input and output paths are absolute, so the script does not depend on the directory dc_shell runs in
     synt_script = open("dc_scripts/synt.dc", 'r').read()
-    synt_script = synt_script.replace('input.v', str(benchmark_fname))
+    synt_script = synt_script.replace('input.v', os.path.abspath(benchmark_fname))
     # synt_output_path = tempfile.mktemp()
-    synt_script = synt_script.replace('output.v', synt_output_path)
+    synt_script = synt_script.replace('output.v', os.path.abspath(synt_output_path))
+    if not with_exit:
+        synt_script = "".join(line for line in synt_script.splitlines(True) if line.strip() != "exit")
+    return synt_script
+
+def synt_batch(benchmark_fnames, synt_output_paths, synt_script_path="dc_scripts/synt_batch_temp.dc", workspace=None):
+    # Synthesizes several designs in a single dc_shell session: one read_file/compile/write block per design,
+    # each writing its own output, so the tool startup and the library loading are paid once.
+    # Designs found in the synthesis cache are not synthesized again.
+    # dc_shell runs in workspace (its command.log, default.svf and WORK files), or in the current directory when None.
+    to_synt = []
+    for benchmark_fname, synt_output_path in zip(benchmark_fnames, synt_output_paths):
+        cache_key = None
+        if SYNT_CACHE_DIR is not None:
+            cache_key = synt_cache_key(benchmark_fname)
+            if synt_cache_get(cache_key, synt_output_path):
+                continue
+        if os.path.exists(synt_output_path): # so that a failed run does not leave a stale netlist
+            os.remove(synt_output_path)
+        to_synt.append((benchmark_fname, synt_output_path, cache_key))
+    if not to_synt:
+        return
+    
+    # Create synthesis script. The designs are removed between the blocks, so their names do not clash
+    synt_script = synt_script_header() + "".join(synt_script_block(benchmark_fname, synt_output_path, False) + "remove_design -all\n" for benchmark_fname, synt_output_path, _ in to_synt)
+    open(synt_script_path, "w").write(synt_script + "exit\n")
+    
+    # Run synthesis script. The outputs are cached only when dc_shell succeeded, since a failed
+    # session may leave a truncated netlist behind
+    proc = subprocess.run('dc_shell -f "%s"' % os.path.abspath(synt_script_path), shell=True, cwd=workspace, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    for benchmark_fname, synt_output_path, cache_key in to_synt:
+        if cache_key is not None and proc.returncode == 0 and os.path.exists(synt_output_path):
+            synt_cache_put(cache_key, synt_output_path)
+
+# The outcome of an asynchronous synthesis job. log is the captured dc_shell stdout/stderr
+SyntJob = namedtuple("SyntJob", ["benchmark_fname", "synt_output_path", "returncode", "log", "cached", "timed_out"])
+
+async def synt_async(benchmark_fname, synt_output_path, synt_script_path, semaphore, timeout=None, workspace=None):
+    # Asynchronous version of synt(): dc_shell runs without blocking the event loop, with at most the semaphore's
+    # value of runs at once (e.g. the number of licenses), and is killed after timeout seconds (None - no limit).
+    # Concurrent jobs need their own workspace to run dc_shell in (None - the current directory), see synt().
+    # Returns a SyntJob; the netlist is valid only if returncode is 0 and the job did not time out.
+    cache_key = None
+    if SYNT_CACHE_DIR is not None:
+        cache_key = synt_cache_key(benchmark_fname)
+        if synt_cache_get(cache_key, synt_output_path):
+            return SyntJob(benchmark_fname, synt_output_path, 0, "", True, False)
+    if os.path.exists(synt_output_path): # so that a failed run does not leave a stale netlist
+        os.remove(synt_output_path)
+    open(synt_script_path, "w").write(synt_script_header() + synt_script_block(benchmark_fname, synt_output_path))
+    
+    async with semaphore:
+        proc = await asyncio.create_subprocess_exec("dc_shell", "-f", os.path.abspath(synt_script_path), cwd=workspace, stdout=asyncio.subprocess.PIPE, stderr=asyncio.subprocess.STDOUT)
+        try:
+            log, _ = await asyncio.wait_for(proc.communicate(), timeout)
+            timed_out = False
+        except asyncio.TimeoutError:
+            proc.kill()
+            log, _ = await proc.communicate()
+            timed_out = True
+    
+    returncode = proc.returncode if os.path.exists(synt_output_path) else (proc.returncode or 1)
+    if cache_key is not None and returncode == 0 and not timed_out:
+        synt_cache_put(cache_key, synt_output_path)
+    return SyntJob(benchmark_fname, synt_output_path, returncode, log.decode(errors="replace"), False, timed_out)
+
+def synt(benchmark_fname, synt_output_path, synt_script_path="dc_scripts/synt_temp.dc", workspace=None):
+    # dc_shell runs in workspace (its command.log, default.svf and WORK files), or in the current directory when None
+    
+    # Reuse a previous synthesis of the same inputs
+    if SYNT_CACHE_DIR is not None:
+        cache_key = synt_cache_key(benchmark_fname)
+        if synt_cache_get(cache_key, synt_output_path):
+            return
+        if os.path.exists(synt_output_path): # so that a failed run does not cache a stale netlist
+            os.remove(synt_output_path)
+    
+    # Create synthesis script
+    synt_script = synt_script_header() + synt_script_block(benchmark_fname, synt_output_path)
     
-    # Run synthesis script
-    synt_script_path = "dc_scripts/synt_temp.dc"
+    # Run synthesis script. The output is cached only when dc_shell succeeded, since a failed run may leave a truncated netlist behind
     open(synt_script_path, "w").write(synt_script)
-    subprocess.run('dc_shell -f "%s"' % synt_script_path, shell=True, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    proc = subprocess.run('dc_shell -f "%s"' % os.path.abspath(synt_script_path), shell=True, cwd=workspace, stdout=subprocess.DEVNULL, stderr=subprocess.STDOUT)
+    if SYNT_CACHE_DIR is not None and proc.returncode == 0 and os.path.exists(synt_output_path):
+        synt_cache_put(cache_key, synt_output_path)
     
     # Check the used opcodes and the total number of cycles
     synt_opcodes = []